@@ -0,0 +1,206 @@
+"""Agregações vetorizadas sobre os códigos inteiros das colunas categóricas.
+
+Em vez de materializar o DataFrame filtrado e agrupar com pandas, as agregações
+leem os códigos das colunas da base (dataset, cubo ou células da consulta SQL)
+nas posições selecionadas e contam com np.bincount, ponderando pela coluna de
+peso quando a base é agregada.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Selecao:
+    """Linhas selecionadas de uma base e a coluna de peso de cada linha.
+
+    :param base: Dataset tratado, cubo ou células agregadas
+    :type base: pd.DataFrame
+    :param linhas: Posições selecionadas na base, defaults to todas as linhas
+    :type linhas: np.ndarray, optional
+    :param peso: Coluna com o número de notificações de cada linha, defaults to
+        None (cada linha é uma notificação)
+    :type peso: str, optional
+    :param matrizes: Matrizes 2-D alinhadas às linhas da base, por nome,
+        defaults to None
+    :type matrizes: dict[str, np.ndarray], optional
+    """
+
+    def __init__(
+        self,
+        base: pd.DataFrame,
+        linhas: np.ndarray | None = None,
+        peso: str | None = None,
+        matrizes: dict[str, np.ndarray] | None = None,
+    ):
+        self.base = base
+        self.linhas = linhas
+        self.peso = peso
+        self.matrizes = matrizes or {}
+
+    def __len__(self) -> int:
+        return len(self.base) if self.linhas is None else len(self.linhas)
+
+    def coluna(self, nome: str) -> np.ndarray:
+        """Valores da coluna nas linhas selecionadas"""
+        valores = self.base[nome].to_numpy()
+        return valores if self.linhas is None else valores[self.linhas]
+
+    def codigos(self, nome: str) -> tuple[np.ndarray, list]:
+        """Códigos da coluna nas linhas selecionadas e os valores de cada código.
+
+        Nulos têm código -1.
+        """
+        serie = self.base[nome]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy()
+            categorias = serie.cat.categories.tolist()
+            if self.linhas is not None:
+                codigos = codigos[self.linhas]
+        else:
+            # Só os valores das linhas selecionadas são fatorados
+            valores = serie.to_numpy()
+            if self.linhas is not None:
+                valores = valores[self.linhas]
+            codigos, categorias = pd.factorize(valores, sort=True)
+            categorias = categorias.tolist()
+        return codigos, categorias
+
+    def restringe(self, mascara: np.ndarray) -> "Selecao":
+        """Seleção só com as linhas selecionadas em que a máscara é verdadeira"""
+        linhas = (
+            np.flatnonzero(mascara) if self.linhas is None else self.linhas[mascara]
+        )
+        return Selecao(self.base, linhas, self.peso, self.matrizes)
+
+    def pesos(self) -> np.ndarray | None:
+        """Peso de cada linha selecionada, None quando todas valem 1"""
+        return None if self.peso is None else self.coluna(self.peso)
+
+    def soma_matriz(self, nome: str, colunas: list[str]) -> np.ndarray:
+        """Soma de cada coluna de uma matriz nas linhas selecionadas, numa única
+        redução vetorizada.
+
+        As colunas são aditivas por linha (indicadores no dataset, somas nas
+        células do cubo), então não são ponderadas. Sem a matriz `nome`, ela é
+        montada a partir das colunas da base.
+
+        :param nome: Nome da matriz
+        :type nome: str
+        :param colunas: Colunas da base que formam a matriz, na ordem da matriz
+        :type colunas: list[str]
+        :return: Soma int64 de cada coluna
+        :rtype: np.ndarray
+        """
+        matriz = self.matrizes.get(nome)
+        if matriz is None:
+            matriz = self.base[colunas].to_numpy()
+        if self.linhas is not None:
+            matriz = matriz[self.linhas]
+        return np.add.reduce(matriz, axis=0, dtype=np.int64)
+
+
+def contagem_2d(
+    codigos_a: np.ndarray,
+    n_a: int,
+    codigos_b: np.ndarray,
+    n_b: int,
+    pesos: np.ndarray | None = None,
+) -> np.ndarray:
+    """Tabela de contingência de dois códigos inteiros num único np.bincount.
+
+    Linhas com código negativo (nulo) em qualquer das dimensões são ignoradas.
+
+    :param codigos_a: Códigos da dimensão das linhas da tabela, em [0, n_a)
+    :type codigos_a: np.ndarray
+    :param n_a: Número de valores da dimensão das linhas
+    :type n_a: int
+    :param codigos_b: Códigos da dimensão das colunas da tabela, em [0, n_b)
+    :type codigos_b: np.ndarray
+    :param n_b: Número de valores da dimensão das colunas
+    :type n_b: int
+    :param pesos: Peso de cada linha, defaults to 1
+    :type pesos: np.ndarray, optional
+    :return: Matriz (n_a, n_b) de contagens int64
+    :rtype: np.ndarray
+    """
+    validos = (codigos_a >= 0) & (codigos_b >= 0)
+    if not validos.all():
+        codigos_a, codigos_b = codigos_a[validos], codigos_b[validos]
+        pesos = None if pesos is None else pesos[validos]
+
+    celula = codigos_a.astype(np.int64) * n_b + codigos_b
+    contagens = np.bincount(celula, weights=pesos, minlength=n_a * n_b)
+    return contagens.astype(np.int64).reshape(n_a, n_b)
+
+
+def contagens_categoricas(
+    selecao: Selecao, colunas: list[str], rotulo_nulo: str = "Não informado"
+) -> dict[str, pd.Series]:
+    """Contagem por valor de várias colunas categóricas, um np.bincount sobre os
+    códigos inteiros de cada coluna, sem converter valores em texto.
+
+    Os nulos recebem um código próprio, logo após o último valor da coluna.
+
+    :param selecao: Linhas selecionadas
+    :type selecao: Selecao
+    :param colunas: Colunas contadas
+    :type colunas: list[str]
+    :param rotulo_nulo: Rótulo da contagem de nulos, defaults to "Não informado"
+    :type rotulo_nulo: str, optional
+    :return: Contagem int64 por valor (nulos por último) de cada coluna
+    :rtype: dict[str, pd.Series]
+    """
+    pesos = selecao.pesos()
+    resultado = {}
+    for coluna in colunas:
+        codigos, categorias = selecao.codigos(coluna)
+        n = len(categorias)
+        codigos = np.where(codigos < 0, n, codigos)
+        contagens = np.bincount(codigos, weights=pesos, minlength=n + 1)
+        resultado[coluna] = pd.Series(
+            contagens.astype(np.int64),
+            index=[str(c) for c in categorias] + [rotulo_nulo],
+        )
+    return resultado
+
+
+def tabela_cruzada(selecao: Selecao, linha: str, coluna: str) -> pd.DataFrame:
+    """Contagens e percentuais por linha do cruzamento de duas colunas, a partir
+    dos códigos inteiros das colunas num único np.bincount 2-D.
+
+    Só as combinações presentes na seleção entram no resultado, na ordem dos
+    valores de cada coluna. Linhas com nulo em alguma das colunas são ignoradas.
+
+    :param selecao: Linhas selecionadas
+    :type selecao: Selecao
+    :param linha: Coluna cujos valores formam as linhas da tabela
+    :type linha: str
+    :param coluna: Coluna cujos valores formam as colunas da tabela
+    :type coluna: str
+    :return: Uma linha por combinação, com as colunas `linha`, `coluna`,
+        "contagem" e "percentual" (da contagem no total da linha, de 0 a 100)
+    :rtype: pd.DataFrame
+    """
+    codigos_a, valores_a = selecao.codigos(linha)
+    codigos_b, valores_b = selecao.codigos(coluna)
+    contagens = contagem_2d(
+        codigos_a,
+        len(valores_a),
+        codigos_b,
+        len(valores_b),
+        selecao.pesos(),
+    )
+
+    totais = contagens.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percentuais = contagens / totais * 100
+
+    i, j = np.nonzero(contagens)
+    return pd.DataFrame(
+        {
+            linha: pd.Index(valores_a)[i],
+            coluna: pd.Index(valores_b)[j],
+            "contagem": contagens[i, j],
+            "percentual": percentuais[i, j],
+        }
+    )
@@ -0,0 +1,234 @@
+"""Armazém colunar do dataset tratado: um arquivo .npy por coluna, anexado via memory map.
+
+Todos os processos do app que anexam o mesmo armazém compartilham as páginas do
+arquivo pelo cache do sistema operacional, então o dataset ocupa memória uma única
+vez independentemente do número de workers. Os arrays são somente leitura.
+
+Grupos de colunas indicadoras (os sintomas) podem ser gravados como uma única
+matriz 2-D contígua de uint8; as colunas do DataFrame são visões dessa matriz.
+Os índices dos filtros também podem ser gravados, para que os workers os
+anexem em vez de recalculá-los cada um na sua memória.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from indices import IndiceInvertido, IndiceOrdenado
+
+ARQUIVO_META = "meta.json"
+CLASSES_INDICE = {"invertido": IndiceInvertido, "ordenado": IndiceOrdenado}
+
+
+def grava_armazem(
+    df: pd.DataFrame,
+    pasta: str,
+    matrizes: dict[str, list[str]] | None = None,
+    indices: dict[str, list[str]] | None = None,
+):
+    """Grava o DataFrame como armazém colunar.
+
+    Categóricas são gravadas como códigos + categorias, inteiros anuláveis como
+    valores + máscara de nulos e as demais colunas como o próprio array numpy.
+    A pasta é montada ao lado e trocada no final para que workers em execução
+    nunca vejam um armazém pela metade.
+
+    :param df: Dataset tratado
+    :type df: pd.DataFrame
+    :param pasta: Pasta do armazém
+    :type pasta: str
+    :param matrizes: Grupos de colunas indicadoras gravados como uma matriz
+        uint8 (nome da matriz: colunas), defaults to None
+    :type matrizes: dict[str, list[str]], optional
+    :param indices: Colunas com índice invertido ("invertido") e ordenado
+        ("ordenado") gravados no armazém, defaults to None
+    :type indices: dict[str, list[str]], optional
+    """
+    temporaria = pasta.rstrip("/") + ".tmp"
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+
+    matrizes = matrizes or {}
+    na_matriz = {}
+    for nome_matriz, colunas_matriz in matrizes.items():
+        largas = [c for c in colunas_matriz if df[c].dtype.itemsize != 1]
+        if largas:
+            # As colunas são lidas como visões da matriz de 1 byte por valor
+            raise ValueError(
+                f"Colunas da matriz {nome_matriz} devem ter 1 byte por valor: {largas}"
+            )
+        np.save(
+            os.path.join(temporaria, f"matriz_{nome_matriz}.npy"),
+            np.ascontiguousarray(df[colunas_matriz].to_numpy(dtype=np.uint8)),
+        )
+        for indice, nome in enumerate(colunas_matriz):
+            na_matriz[nome] = (nome_matriz, indice)
+
+    colunas = []
+    for i, (nome, serie) in enumerate(df.items()):
+        if nome in na_matriz:
+            nome_matriz, indice = na_matriz[nome]
+            colunas.append(
+                {
+                    "nome": nome,
+                    "tipo": "matriz",
+                    "matriz": nome_matriz,
+                    "indice": indice,
+                    "dtype": str(serie.dtype),
+                }
+            )
+            continue
+
+        if serie.dtype == object:
+            serie = serie.astype("category")
+
+        coluna = {"nome": nome, "arquivo": f"{i:03d}"}
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            coluna["tipo"] = "categorica"
+            coluna["categorias"] = serie.cat.categories.astype(str).tolist()
+            coluna["ordenada"] = bool(serie.cat.ordered)
+            arrays = {"codigos": serie.cat.codes.to_numpy()}
+        elif isinstance(serie.array, pd.arrays.IntegerArray):
+            coluna["tipo"] = "inteira_anulavel"
+            arrays = {
+                "valores": serie.to_numpy(dtype=serie.dtype.numpy_dtype, na_value=0),
+                "nulos": serie.isna().to_numpy(),
+            }
+        else:
+            coluna["tipo"] = "numpy"
+            arrays = {"valores": serie.to_numpy()}
+
+        for sufixo, array in arrays.items():
+            np.save(
+                os.path.join(temporaria, f"{coluna['arquivo']}_{sufixo}.npy"), array
+            )
+        colunas.append(coluna)
+
+    meta_indices = {}
+    for tipo, colunas_indice in (indices or {}).items():
+        meta_indices[tipo] = {}
+        for nome in colunas_indice:
+            indice = CLASSES_INDICE[tipo](df[nome])
+            arquivo = f"indice_{tipo}_{df.columns.get_loc(nome):03d}"
+            for sufixo, array in indice.arrays().items():
+                np.save(os.path.join(temporaria, f"{arquivo}_{sufixo}.npy"), array)
+            meta_indices[tipo][nome] = {
+                "arquivo": arquivo,
+                "arrays": list(indice.arrays()),
+            }
+            if tipo == "invertido":
+                meta_indices[tipo][nome]["categorias"] = [
+                    str(valor) for valor in indice.codigos
+                ]
+
+    with open(os.path.join(temporaria, ARQUIVO_META), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "linhas": len(df),
+                "colunas": colunas,
+                "matrizes": matrizes,
+                "indices": meta_indices,
+            },
+            f,
+            ensure_ascii=False,
+        )
+
+    shutil.rmtree(pasta, ignore_errors=True)
+    os.replace(temporaria, pasta)
+
+
+def anexa_armazem(pasta: str) -> pd.DataFrame:
+    """Monta um DataFrame sobre os arquivos do armazém sem copiar os dados.
+
+    :param pasta: Pasta do armazém
+    :type pasta: str
+    :return: DataFrame somente leitura apoiado nos arquivos mapeados em memória
+    :rtype: pd.DataFrame
+    """
+    meta = le_meta(pasta)
+
+    def carrega(coluna: dict, sufixo: str) -> np.ndarray:
+        caminho = os.path.join(pasta, f"{coluna['arquivo']}_{sufixo}.npy")
+        return np.load(caminho, mmap_mode="r")
+
+    matrizes = {nome: anexa_matriz(pasta, nome) for nome in meta.get("matrizes", {})}
+
+    dados = {}
+    for coluna in meta["colunas"]:
+        if coluna["tipo"] == "matriz":
+            # Visão da coluna dentro da matriz, com o dtype original da coluna.
+            # Armazéns antigos podem registrar dtypes mais largos: esses são
+            # convertidos (cópia), já que a visão exige o mesmo tamanho
+            valores = matrizes[coluna["matriz"]][:, coluna["indice"]]
+            if np.dtype(coluna["dtype"]).itemsize == valores.itemsize:
+                dados[coluna["nome"]] = valores.view(coluna["dtype"])
+            else:
+                dados[coluna["nome"]] = valores.astype(coluna["dtype"])
+        elif coluna["tipo"] == "categorica":
+            dados[coluna["nome"]] = pd.Categorical.from_codes(
+                carrega(coluna, "codigos"),
+                categories=coluna["categorias"],
+                ordered=coluna["ordenada"],
+                validate=False,
+            )
+        elif coluna["tipo"] == "inteira_anulavel":
+            dados[coluna["nome"]] = pd.arrays.IntegerArray(
+                carrega(coluna, "valores"), carrega(coluna, "nulos"), copy=False
+            )
+        else:
+            dados[coluna["nome"]] = carrega(coluna, "valores")
+
+    # copy=False mantém cada coluna no seu próprio bloco, sem consolidar (e copiar)
+    return pd.DataFrame(dados, index=pd.RangeIndex(meta["linhas"]), copy=False)
+
+
+def le_meta(pasta: str) -> dict:
+    with open(os.path.join(pasta, ARQUIVO_META), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def anexa_matriz(pasta: str, nome: str) -> np.ndarray | None:
+    """Matriz de colunas indicadoras do armazém, mapeada em memória.
+
+    :param pasta: Pasta do armazém
+    :type pasta: str
+    :param nome: Nome da matriz
+    :type nome: str
+    :return: Matriz (linhas, colunas) uint8, ou None se o armazém não a tem
+    :rtype: np.ndarray | None
+    """
+    caminho = os.path.join(pasta, f"matriz_{nome}.npy")
+    if not os.path.exists(caminho):
+        return None
+    return np.load(caminho, mmap_mode="r")
+
+
+def anexa_indices(pasta: str, tipo: str) -> dict | None:
+    """Índices de um tipo gravados no armazém, sobre arrays mapeados em memória.
+
+    :param pasta: Pasta do armazém
+    :type pasta: str
+    :param tipo: "invertido" ou "ordenado"
+    :type tipo: str
+    :return: Índice de cada coluna, ou None se o armazém não tem índices do tipo
+    :rtype: dict | None
+    """
+    meta_indices = le_meta(pasta).get("indices", {}).get(tipo)
+    if not meta_indices:
+        return None
+
+    indices = {}
+    for nome, meta in meta_indices.items():
+        arrays = {
+            sufixo: np.load(
+                os.path.join(pasta, f"{meta['arquivo']}_{sufixo}.npy"), mmap_mode="r"
+            )
+            for sufixo in meta["arrays"]
+        }
+        if tipo == "invertido":
+            arrays["categorias"] = meta["categorias"]
+        indices[nome] = CLASSES_INDICE[tipo].de_arrays(**arrays)
+    return indices
@@ -0,0 +1,300 @@
+"""Backend SQL embutido: filtros e agregações como consultas DuckDB sobre o Parquet.
+
+O DuckDB lê o arquivo do dataset diretamente, com varreduras em várias threads
+e sem precisar que o dataset caiba em memória. Cada estado de filtro vira uma
+única consulta que agrega as linhas filtradas nas dimensões do cubo, e os
+gráficos são montados a partir dessas células pelas mesmas funções usadas
+sobre o cubo pré-agregado.
+
+O DuckDB é uma dependência opcional, necessária só para este backend.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from colunas_derivadas import FAIXAS_ETARIAS
+from cubo import (
+    DIMENSOES_CATEGORICAS,
+    DIMENSOES_CUBO,
+    MEDIDAS_CUBO,
+    deriva_classificacao,
+    tipa_cubo,
+)
+from tratamento_dado import SINTOMAS
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Colunas das linhas do dataset, sem a posição da linha no arquivo exposta na view
+COLUNAS_DATASET = "* EXCLUDE (file_row_number)"
+# Categóricas ordenadas: ordenadas pela posição do valor, como no pandas, e não
+# pelo texto ("<18" antes de "18-29")
+ORDENS_CATEGORICAS = {"faixaEtaria": FAIXAS_ETARIAS}
+# Inteiros lidos como inteiros anuláveis, como no dataset tratado (sem isso, as
+# colunas com nulos, como idade, viram float64)
+INTEIROS_ANULAVEIS = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+}
+
+
+def citado(coluna: str) -> str:
+    """Identificador SQL entre aspas (nomes de sintomas têm espaços e acentos)"""
+    return '"' + coluna.replace('"', '""') + '"'
+
+
+def literal(texto: str) -> str:
+    """Literal de texto SQL (o CREATE VIEW não aceita parâmetros)"""
+    return "'" + texto.replace("'", "''") + "'"
+
+
+def tipos_categoricos(arquivo: str) -> dict[str, pd.CategoricalDtype]:
+    """Dtype de cada coluna categórica (dicionário) do Parquet, com as categorias
+    na ordem em que o pandas as lê, unindo os dicionários dos grupos de linhas um
+    grupo por vez, sem ler o arquivo inteiro"""
+    arquivo_parquet = pq.ParquetFile(arquivo)
+    colunas = [
+        campo.name
+        for campo in arquivo_parquet.schema_arrow
+        if pa.types.is_dictionary(campo.type)
+    ]
+    categorias = {coluna: {} for coluna in colunas}
+    for grupo in range(arquivo_parquet.num_row_groups):
+        tabela = arquivo_parquet.read_row_group(grupo, columns=colunas)
+        for coluna in colunas:
+            for pedaco in tabela[coluna].chunks:
+                categorias[coluna].update(dict.fromkeys(pedaco.dictionary.to_pylist()))
+    return {
+        coluna: pd.CategoricalDtype(
+            list(categorias[coluna]),
+            ordered=arquivo_parquet.schema_arrow.field(coluna).type.ordered,
+        )
+        for coluna in colunas
+    }
+
+
+def chave_ordenacao(coluna: str) -> str:
+    """Expressão SQL pela qual a coluna é ordenada na tabela"""
+    if coluna in ORDENS_CATEGORICAS:
+        valores = ", ".join(literal(v) for v in ORDENS_CATEGORICAS[coluna])
+        return f"list_position([{valores}], {citado(coluna)})"
+    return citado(coluna)
+
+
+def expressao(coluna: str) -> str:
+    """Expressão SQL de uma dimensão ou medida do cubo"""
+    expressoes = {
+        "idadeNula": "idade IS NULL",
+        "contagem": "COUNT(*)",
+        "idade_soma": "COALESCE(SUM(idade), 0)::BIGINT",
+        "idade_contagem": "COUNT(idade)",
+    }
+    if coluna in expressoes:
+        return expressoes[coluna]
+    if coluna in SINTOMAS:
+        return f"SUM({citado(coluna)})::BIGINT"
+    return citado(coluna)
+
+
+class BackendDuckDB:
+    """Consultas SQL sobre o dataset tratado em Parquet.
+
+    :param arquivo: Caminho do dataset tratado em Parquet
+    :type arquivo: str
+    :param threads: Threads usadas pelo DuckDB, defaults to o número de núcleos
+    :type threads: int, optional
+    :raises ImportError: Se o DuckDB não está instalado
+    """
+
+    def __init__(self, arquivo: str, threads: int | None = None):
+        if duckdb is None:
+            raise ImportError("O backend SQL requer o pacote duckdb")
+
+        self.conexao = duckdb.connect()
+        if threads:
+            self.conexao.execute(f"SET threads = {int(threads)}")
+        # file_row_number desempata ordenações, na ordem das linhas do arquivo
+        self.conexao.execute(
+            "CREATE VIEW dataset AS SELECT * FROM "
+            f"read_parquet({literal(arquivo)}, file_row_number = true)"
+        )
+        # Esquema Arrow das linhas, de onde vêm os nomes das colunas
+        self.esquema = (
+            self.consulta(f"SELECT {COLUNAS_DATASET} FROM dataset LIMIT 0")
+            .fetch_arrow_table()
+            .schema
+        )
+        # Categóricas das linhas exportadas, com as categorias do dataset tratado
+        self.categoricas = tipos_categoricos(arquivo)
+        # Categorias completas, para que os agregados de uma seleção tenham as
+        # mesmas categorias (e zeros) que os do backend pandas
+        self.categorias = {
+            coluna: [
+                valor
+                for (valor,) in self.consulta(
+                    f"SELECT DISTINCT {citado(coluna)} FROM dataset "
+                    f"WHERE {citado(coluna)} IS NOT NULL ORDER BY 1"
+                ).fetchall()
+            ]
+            for coluna in DIMENSOES_CATEGORICAS
+        }
+
+    def dominio(self) -> dict:
+        """Faixas e valores dos controles de filtro e colunas do dataset, lidos
+        com SQL em vez de carregar o dataset (ver shared.calcula_dominio)"""
+        idade_min, idade_max, data_min, data_max = self.consulta(
+            "SELECT MIN(idade), MAX(idade), MIN(dataNotificacao), "
+            "MAX(dataNotificacao) FROM dataset"
+        ).fetchone()
+        dominio = {
+            "idade": (int(idade_min), int(idade_max)),
+            "dataNotificacao": (pd.Timestamp(data_min), pd.Timestamp(data_max)),
+            "colunas": list(self.esquema.names),
+        }
+        for coluna in DIMENSOES_CATEGORICAS:
+            # Em ordem de aparição, com os nulos como NaN, como no pandas
+            dominio[coluna] = [
+                np.nan if valor is None else valor
+                for (valor,) in self.consulta(
+                    f"SELECT {citado(coluna)} FROM dataset "
+                    f"GROUP BY {citado(coluna)} ORDER BY MIN(file_row_number)"
+                ).fetchall()
+            ]
+        return dominio
+
+    def consulta(self, sql: str, parametros: list | None = None):
+        # Um cursor por consulta: a conexão não deve ser compartilhada entre threads
+        return self.conexao.cursor().execute(sql, parametros or [])
+
+    @staticmethod
+    def condicao(chave: tuple) -> tuple[str, list]:
+        """Cláusula WHERE equivalente ao estado dos filtros.
+
+        :param chave: Forma canônica do estado dos filtros (normaliza_filtro)
+        :type chave: tuple
+        :return: Condição SQL e seus parâmetros
+        :rtype: tuple[str, list]
+        """
+        (
+            (idade_min, idade_max, nulas_idade),
+            (data_min, data_max, nulas_data),
+            raca_cor,
+            sexo,
+            municipio,
+            classificacao_final,
+        ) = chave
+
+        condicoes = [
+            "(idade BETWEEN ? AND ?" + (" OR idade IS NULL)" if nulas_idade else ")"),
+            "(dataNotificacao BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)"
+            + (" OR dataNotificacao IS NULL)" if nulas_data else ")"),
+        ]
+        parametros = [int(idade_min), int(idade_max), data_min, data_max]
+
+        # Checkboxes: "nan" seleciona os nulos
+        for coluna, selecionados in (("racaCor", raca_cor), ("sexo", sexo)):
+            valores = [v for v in selecionados if v != "nan"]
+            partes = []
+            if valores:
+                partes.append(f"{citado(coluna)} IN ({', '.join('?' * len(valores))})")
+                parametros += valores
+            if "nan" in selecionados:
+                partes.append(f"{citado(coluna)} IS NULL")
+            condicoes.append("(" + (" OR ".join(partes) or "FALSE") + ")")
+
+        # Seleção múltipla: vazia não restringe
+        for coluna, selecionados in (
+            ("municipio", municipio),
+            ("classificacaoFinal", classificacao_final),
+        ):
+            if selecionados:
+                condicoes.append(
+                    f"{citado(coluna)} IN ({', '.join('?' * len(selecionados))})"
+                )
+                parametros += list(selecionados)
+
+        return " AND ".join(condicoes), parametros
+
+    def filtra(
+        self,
+        chave: tuple,
+        limite: int | None = None,
+        deslocamento: int = 0,
+        ordem: str | None = None,
+        decrescente: bool = False,
+    ) -> pd.DataFrame:
+        """Linhas do dataset que passam nos filtros, opcionalmente só uma página.
+
+        :param chave: Forma canônica do estado dos filtros (normaliza_filtro)
+        :type chave: tuple
+        :param limite: Número máximo de linhas, defaults to todas
+        :type limite: int, optional
+        :param deslocamento: Linhas puladas antes da página, defaults to 0
+        :type deslocamento: int, optional
+        :param ordem: Coluna da ordenação (nulos por último), defaults to a
+            ordem do dataset
+        :type ordem: str, optional
+        :param decrescente: Se a ordem é decrescente, defaults to False
+        :type decrescente: bool, optional
+        """
+        where, parametros = self.condicao(chave)
+        sql = f"SELECT {COLUNAS_DATASET} FROM dataset WHERE {where} ORDER BY "
+        if ordem is not None:
+            direcao = "DESC" if decrescente else "ASC"
+            sql += f"{chave_ordenacao(ordem)} {direcao} NULLS LAST, "
+        # Empates na ordem do arquivo: páginas estáveis e a mesma ordem do pandas
+        sql += "file_row_number"
+        if limite is not None:
+            sql += f" LIMIT {int(limite)} OFFSET {int(deslocamento)}"
+        return self.consulta(sql, parametros).df()
+
+    def lotes(self, chave: tuple, linhas_por_lote: int):
+        """Linhas do dataset que passam nos filtros, lidas em lotes de DataFrames
+        à medida que são consumidas (um lote vazio quando não há linhas)"""
+        where, parametros = self.condicao(chave)
+        leitor = self.consulta(
+            f"SELECT {COLUNAS_DATASET} FROM dataset WHERE {where}", parametros
+        ).fetch_record_batch(linhas_por_lote)
+        vazio = True
+        for lote in leitor:
+            vazio = False
+            yield self.tipa_lote(lote)
+        if vazio:
+            yield self.tipa_lote(leitor.schema.empty_table())
+
+    def tipa_lote(self, lote: pa.RecordBatch | pa.Table) -> pd.DataFrame:
+        """Lote lido do DuckDB com os dtypes do dataset tratado (o DuckDB devolve
+        as categóricas como texto)"""
+        return lote.to_pandas(types_mapper=INTEIROS_ANULAVEIS.get).astype(
+            self.categoricas
+        )
+
+    def agrega(
+        self,
+        chave: tuple,
+        dimensoes: list[str] = DIMENSOES_CUBO,
+        medidas: list[str] = MEDIDAS_CUBO,
+    ) -> pd.DataFrame:
+        """Linhas filtradas agregadas nas dimensões informadas, numa única varredura.
+
+        O resultado tem as colunas e dtypes de uma fatia do cubo, com
+        "contagem" como peso de cada célula.
+        """
+        where, parametros = self.condicao(chave)
+        selecao = ", ".join(
+            f"{expressao(coluna)} AS {citado(coluna)}" for coluna in dimensoes + medidas
+        )
+        celulas = self.consulta(
+            f"SELECT {selecao} FROM dataset WHERE {where} GROUP BY ALL",
+            parametros,
+        ).df()
+
+        if "idadeNula" in celulas:
+            celulas["idadeNula"] = celulas["idadeNula"].astype(np.bool_)
+        return deriva_classificacao(tipa_cubo(celulas, self.categorias))
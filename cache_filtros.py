@@ -0,0 +1,138 @@
+"""Cache LRU de resultados de filtro, compartilhado por todas as sessões do processo"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def tamanho_bytes(valor) -> int:
+    """Estimativa da memória ocupada por um valor guardado no cache"""
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, (tuple, list)):
+        return sum(tamanho_bytes(v) for v in valor)
+    if isinstance(valor, dict):
+        return sum(tamanho_bytes(v) for v in valor.values())
+    return sys.getsizeof(valor)
+
+
+class CacheFiltros:
+    """Cache LRU indexado pela forma canônica do estado dos filtros.
+
+    Cada entrada guarda a seleção de linhas e os agregados de cada gráfico
+    calculados para aquele estado, de forma que sessões diferentes com os mesmos
+    filtros (o estado padrão, um município popular...) reaproveitam o trabalho.
+    As entradas menos usadas são descartadas ao passar do limite de entradas ou
+    de memória.
+
+    :param max_entradas: Número máximo de estados de filtro guardados, defaults to 256
+    :type max_entradas: int, optional
+    :param max_bytes: Memória máxima ocupada pelo cache, defaults to 512 MB
+    :type max_bytes: int, optional
+    :param intervalo_log: Segundos entre as impressões dos contadores do cache,
+        defaults to 60 (None desliga)
+    :type intervalo_log: float, optional
+    """
+
+    def __init__(
+        self,
+        max_entradas: int = 256,
+        max_bytes: int = 512 * 1024**2,
+        intervalo_log: float | None = 60.0,
+    ):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.intervalo_log = intervalo_log
+        self.ultimo_log = time.monotonic()
+        self.entradas = OrderedDict()
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.lock = threading.Lock()
+
+    def obtem(self, chave: tuple, nome: str, calcula):
+        """Retorna o valor `nome` guardado para o estado `chave`, calculando e
+        guardando em caso de falha.
+
+        Valores guardados são compartilhados entre sessões e não devem ser alterados.
+
+        :param chave: Forma canônica do estado dos filtros
+        :type chave: tuple
+        :param nome: Identificador do valor (seleção de linhas ou agregado de um gráfico)
+        :type nome: str
+        :param calcula: Função sem argumentos que calcula o valor
+        :type calcula: Callable
+        """
+        self.registra_estatisticas()
+        with self.lock:
+            entrada = self.entradas.get(chave)
+            if entrada is not None and nome in entrada:
+                self.entradas.move_to_end(chave)
+                self.acertos += 1
+                return entrada[nome]
+            self.falhas += 1
+
+        # Calcula fora do lock: um cálculo em dobro é preferível a serializar sessões
+        valor = calcula()
+        if isinstance(valor, np.ndarray):
+            valor.setflags(write=False)
+        self.guarda(chave, nome, valor)
+        return valor
+
+    def guarda(self, chave: tuple, nome: str, valor):
+        tamanho = tamanho_bytes(valor)
+        if tamanho > self.max_bytes:
+            return
+
+        with self.lock:
+            entrada = self.entradas.setdefault(chave, {})
+            if nome in entrada:
+                self.bytes -= tamanho_bytes(entrada[nome])
+            entrada[nome] = valor
+            self.bytes += tamanho
+            self.entradas.move_to_end(chave)
+
+            while len(self.entradas) > self.max_entradas or (
+                self.bytes > self.max_bytes and len(self.entradas) > 1
+            ):
+                _, removida = self.entradas.popitem(last=False)
+                self.bytes -= tamanho_bytes(removida)
+
+    def estatisticas(self) -> dict:
+        """Contadores de acertos e falhas e ocupação atual do cache"""
+        with self.lock:
+            total = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / total if total else 0.0,
+                "entradas": len(self.entradas),
+                "bytes": self.bytes,
+            }
+
+    def registra_estatisticas(self):
+        """Imprime os contadores do cache quando passou intervalo_log desde a
+        última impressão"""
+        if self.intervalo_log is None:
+            return
+        with self.lock:
+            agora = time.monotonic()
+            if agora - self.ultimo_log < self.intervalo_log:
+                return
+            self.ultimo_log = agora
+        estatisticas = self.estatisticas()
+        print(
+            f"CACHE DE FILTROS: {estatisticas['acertos']} acertos, "
+            f"{estatisticas['falhas']} falhas "
+            f"({estatisticas['taxa_acerto']:.0%} de acerto), "
+            f"{estatisticas['entradas']} entradas, "
+            f"{estatisticas['bytes'] / 1024**2:.1f} MB"
+        )
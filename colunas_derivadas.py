@@ -0,0 +1,130 @@
+"""Colunas derivadas, calculadas uma única vez na ingestão e gravadas junto com o dataset"""
+
+import numpy as np
+import pandas as pd
+
+# Faixas etárias da pirâmide (intervalos fechados à esquerda)
+LIMITES_FAIXAS_ETARIAS = [0, 18, 30, 40, 50, 60, 70, 80, 90, 100, np.inf]
+FAIXAS_ETARIAS = [
+    "<18",
+    "18-29",
+    "30-39",
+    "40-49",
+    "50-59",
+    "60-69",
+    "70-79",
+    "80-89",
+    "90-99",
+    "100+",
+]
+# Rótulos de classificacaoFinalSimplificado, -1 indica classificação ausente
+ROTULOS_CLASSIFICACAO = {
+    1: "Confirmado",
+    0: "Negativo",
+    -1: "Não informado",
+}
+
+
+def classificacao_simplificada(df: pd.DataFrame) -> pd.Series:
+    """1 para confirmados, 0 para negativos (descartados e não especificados)
+    e -1 quando não há classificação final"""
+    classificacao = df["classificacaoFinal"]
+    mask_negativo = classificacao.str.contains(
+        "Não Especificada", case=False, na=False
+    ) | classificacao.str.contains("Descartado", case=False, na=False)
+
+    simplificada = np.full(len(df), -1, dtype=np.int8)
+    simplificada[mask_negativo.to_numpy()] = 0
+    simplificada[(~mask_negativo & classificacao.notna()).to_numpy()] = 1
+    return pd.Series(simplificada, index=df.index)
+
+
+def classificacao_rotulo(df: pd.DataFrame) -> pd.Series:
+    """Rótulo categórico de classificacaoFinalSimplificado"""
+    codigos = df["classificacaoFinalSimplificado"].to_numpy()
+    rotulos = pd.Categorical.from_codes(
+        np.select([codigos == 1, codigos == 0], [0, 1], 2),
+        categories=list(ROTULOS_CLASSIFICACAO.values()),
+    )
+    return pd.Series(rotulos, index=df.index)
+
+
+def faixa_etaria(df: pd.DataFrame) -> pd.Series:
+    """Faixa etária categórica (códigos int8), NaN para idades ausentes"""
+    return pd.cut(
+        df["idade"].astype("float64"),
+        bins=LIMITES_FAIXAS_ETARIAS,
+        labels=FAIXAS_ETARIAS,
+        right=False,
+    )
+
+
+def mes_notificacao(df: pd.DataFrame) -> pd.Series:
+    """Código int32 do mês da notificação (ano * 12 + mês - 1), -1 para datas nulas"""
+    data = df["dataNotificacao"]
+    codigo = data.dt.year * 12 + data.dt.month - 1
+    return codigo.fillna(-1).astype(np.int32)
+
+
+def rotulo_mes(codigo: int) -> str:
+    """Converte o código de mês de mes_notificacao para o rótulo AAAA-MM"""
+    ano, mes = divmod(int(codigo), 12)
+    return f"{ano:04d}-{mes + 1:02d}"
+
+
+def dia_notificacao(df: pd.DataFrame) -> pd.Series:
+    """Código int32 do dia da notificação (dias desde 1970-01-01), -1 para datas nulas"""
+    dias = (df["dataNotificacao"] - pd.Timestamp(0)).dt.days
+    return dias.fillna(-1).astype(np.int32)
+
+
+def rotulo_dia(codigo: int) -> str:
+    """Converte o código de dia de dia_notificacao para o rótulo AAAA-MM-DD"""
+    return str(np.datetime64(int(codigo), "D"))
+
+
+def semana_epidemiologica(dias: np.ndarray) -> np.ndarray:
+    """Código da semana epidemiológica (domingo a sábado) de cada código de dia.
+
+    A semana 0 começa no domingo 1969-12-28, 4 dias antes da origem dos códigos.
+    """
+    return (dias + 4) // 7
+
+
+def rotulo_semana(codigo: int) -> str:
+    """Rótulo AAAA-SEnn da semana epidemiológica: a semana pertence ao ano em que
+    caem pelo menos 4 dos seus dias, ou seja, ao ano da sua quarta-feira"""
+    quarta = pd.Timestamp(np.datetime64(int(codigo) * 7 - 4 + 3, "D"))
+    return f"{quarta.year:04d}-SE{(quarta.dayofyear - 1) // 7 + 1:02d}"
+
+
+def mes_do_dia(dias: np.ndarray) -> np.ndarray:
+    """Código de mês (como em mes_notificacao) de cada código de dia"""
+    meses = dias.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return meses + 1970 * 12
+
+
+# Granularidades das séries temporais: código do período a partir do código do
+# dia e rótulo do período
+GRANULARIDADES = {
+    "dia": (lambda dias: dias, rotulo_dia),
+    "semana": (semana_epidemiologica, rotulo_semana),
+    "mes": (mes_do_dia, rotulo_mes),
+}
+
+
+# Registro das colunas derivadas, na ordem em que são calculadas
+COLUNAS_DERIVADAS = {
+    "classificacaoFinalSimplificado": classificacao_simplificada,
+    "classificacaoRotulo": classificacao_rotulo,
+    "faixaEtaria": faixa_etaria,
+    "mesNotificacao": mes_notificacao,
+    "diaNotificacao": dia_notificacao,
+}
+
+
+def aplica_derivadas(df: pd.DataFrame) -> pd.DataFrame:
+    """Acrescenta ao DataFrame todas as colunas do registro COLUNAS_DERIVADAS"""
+    for nome, funcao in COLUNAS_DERIVADAS.items():
+        df[nome] = funcao(df)
+    return df
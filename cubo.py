@@ -0,0 +1,259 @@
+"""Cubo de dados pré-agregado na ingestão.
+
+Todas as dimensões de filtro e de agrupamento do dashboard têm baixa
+cardinalidade, então o dataset é resumido em contagens e somas por combinação
+de mês, sexo, raça/cor, município, classificação, faixa etária e número de
+sintomas. Filtros e gráficos que se alinham a essas dimensões são respondidos
+somando linhas do cubo, com custo proporcional ao tamanho do cubo e não ao
+número de notificações.
+
+A série diária é um segundo cubo, só com contagens por dia e pelas dimensões de
+filtro, de onde saem as séries temporais em qualquer granularidade.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from colunas_derivadas import (
+    FAIXAS_ETARIAS,
+    LIMITES_FAIXAS_ETARIAS,
+    classificacao_rotulo,
+    classificacao_simplificada,
+)
+from indices import IndiceInvertido
+from tratamento_dado import SINTOMAS
+
+DIMENSOES_CUBO = [
+    "mesNotificacao",
+    "sexo",
+    "racaCor",
+    "municipio",
+    "classificacaoFinal",
+    "faixaEtaria",
+    "idadeNula",
+    "numSintomas",
+]
+DIMENSOES_CATEGORICAS = ["sexo", "racaCor", "municipio", "classificacaoFinal"]
+# contagem = linhas da célula; idade_soma / idade_contagem permitem a média de
+# idade; cada sintoma guarda a soma dos indicadores
+MEDIDAS_CUBO = ["contagem", "idade_soma", "idade_contagem"] + SINTOMAS
+
+DIMENSOES_SERIE = [
+    "diaNotificacao",
+    "sexo",
+    "racaCor",
+    "municipio",
+    "classificacaoFinal",
+    "faixaEtaria",
+    "idadeNula",
+]
+MEDIDAS_SERIE = ["contagem"]
+
+
+def constroi_cubo(
+    df: pd.DataFrame,
+    dimensoes: list[str] = DIMENSOES_CUBO,
+    medidas: list[str] = MEDIDAS_CUBO,
+) -> pd.DataFrame:
+    """Agrega um bloco do dataset tratado nas dimensões do cubo.
+
+    O resultado de blocos diferentes pode ser somado com combina_cubos.
+    """
+    idade = df["idade"].astype("float64")
+    base = {}
+    for coluna in dimensoes:
+        if coluna == "idadeNula":
+            base[coluna] = idade.isna().to_numpy()
+        elif isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            base[coluna] = df[coluna].astype(object).to_numpy()
+        else:
+            base[coluna] = df[coluna].to_numpy()
+    for coluna in medidas:
+        if coluna == "contagem":
+            base[coluna] = np.ones(len(df), dtype=np.int64)
+        elif coluna == "idade_soma":
+            base[coluna] = idade.fillna(0).to_numpy()
+        elif coluna == "idade_contagem":
+            base[coluna] = idade.notna().to_numpy(dtype=np.int64)
+        else:
+            base[coluna] = df[coluna].to_numpy(dtype=np.int64)
+
+    return (
+        pd.DataFrame(base)
+        .groupby(dimensoes, dropna=False, sort=False)
+        .sum()
+        .reset_index()
+    )
+
+
+def combina_cubos(
+    cubos: list[pd.DataFrame], dimensoes: list[str] = DIMENSOES_CUBO
+) -> pd.DataFrame:
+    """Soma cubos parciais e fixa os dtypes compactos do cubo final"""
+    cubo = (
+        pd.concat(cubos, ignore_index=True)
+        .groupby(dimensoes, dropna=False, sort=True)
+        .sum()
+        .reset_index()
+    )
+    return tipa_cubo(cubo)
+
+
+def tipa_cubo(cubo: pd.DataFrame, categorias: dict | None = None) -> pd.DataFrame:
+    """Converte as dimensões e medidas de células agregadas para os dtypes do cubo.
+
+    :param cubo: Células agregadas nas dimensões do cubo
+    :type cubo: pd.DataFrame
+    :param categorias: Categorias de cada dimensão categórica, defaults to as
+        encontradas nas próprias células
+    :type categorias: dict, optional
+    """
+    categorias = categorias or {}
+    for coluna in DIMENSOES_CATEGORICAS:
+        if coluna in cubo:
+            cubo[coluna] = pd.Categorical(
+                cubo[coluna], categories=categorias.get(coluna)
+            )
+    if "faixaEtaria" in cubo:
+        cubo["faixaEtaria"] = pd.Categorical(
+            cubo["faixaEtaria"], categories=FAIXAS_ETARIAS, ordered=True
+        )
+    tipos = {
+        "mesNotificacao": np.int32,
+        "diaNotificacao": np.int32,
+        "numSintomas": np.int8,
+        "idade_soma": np.int64,
+    }
+    return cubo.astype({c: t for c, t in tipos.items() if c in cubo})
+
+
+def deriva_classificacao(cubo: pd.DataFrame) -> pd.DataFrame:
+    """Recalcula sobre as células as colunas derivadas da classificação final"""
+    cubo["classificacaoFinalSimplificado"] = classificacao_simplificada(cubo)
+    cubo["classificacaoRotulo"] = classificacao_rotulo(cubo)
+    return cubo
+
+
+def constroi_cubo_parquet(
+    caminho: str,
+    dimensoes: list[str] = DIMENSOES_CUBO,
+    medidas: list[str] = MEDIDAS_CUBO,
+    linhas_por_lote: int = 1_000_000,
+):
+    """Monta o cubo lendo o dataset tratado em lotes, com memória limitada"""
+    arquivo = pq.ParquetFile(caminho)
+    colunas = (
+        [c for c in dimensoes if c != "idadeNula"]
+        + ["idade"]
+        + [c for c in medidas if c in SINTOMAS]
+    )
+    cubos = [
+        constroi_cubo(lote.to_pandas(), dimensoes, medidas)
+        for lote in arquivo.iter_batches(batch_size=linhas_por_lote, columns=colunas)
+    ]
+    return combina_cubos(cubos, dimensoes)
+
+
+class CuboDados:
+    """Cubo carregado no app, com índices para filtrar suas linhas.
+
+    As colunas derivadas de classificação são recalculadas sobre o cubo, de
+    forma que as mesmas funções de agregação servem para linhas do dataset
+    (peso 1) e para linhas do cubo (peso = coluna "contagem"). A dimensão de
+    tempo é o mês (cubo principal) ou o dia (série diária).
+
+    :param cubo: Cubo ou série diária gerados na ingestão
+    :type cubo: pd.DataFrame
+    """
+
+    def __init__(self, cubo: pd.DataFrame):
+        self.cubo = deriva_classificacao(cubo)
+        # Somas de sintomas por célula como matriz contígua, para reduções vetorizadas
+        self.matrizes = (
+            {"sintomas": np.ascontiguousarray(cubo[SINTOMAS].to_numpy(np.int64))}
+            if set(SINTOMAS) <= set(cubo.columns)
+            else {}
+        )
+        self.indices = {
+            coluna: IndiceInvertido(cubo[coluna]) for coluna in DIMENSOES_CATEGORICAS
+        }
+        self.diario = "diaNotificacao" in cubo
+        self.periodo = cubo[
+            "diaNotificacao" if self.diario else "mesNotificacao"
+        ].to_numpy()
+        self.faixa = cubo["faixaEtaria"].cat.codes.to_numpy()
+        self.idade_nula = cubo["idadeNula"].to_numpy()
+        # Limites finitos das faixas etárias (a última faixa é aberta)
+        self.limites_faixas = [int(x) for x in LIMITES_FAIXAS_ETARIAS if np.isfinite(x)]
+
+    def responde_idade(self, inicio: int, fim: int, limites: tuple) -> bool:
+        """Se o intervalo de idade coincide com bordas de faixas etárias"""
+        sem_inicio = inicio <= limites[0]
+        sem_fim = fim >= limites[1]
+        return (sem_inicio or inicio in self.limites_faixas) and (
+            sem_fim or fim + 1 in self.limites_faixas
+        )
+
+    def mascara_idade(
+        self, inicio: int, fim: int, incluir_nulos: bool, limites: tuple
+    ) -> np.ndarray | None:
+        """Máscara das linhas do cubo no intervalo, que deve respeitar responde_idade"""
+        sem_inicio = inicio <= limites[0]
+        sem_fim = fim >= limites[1]
+        if sem_inicio and sem_fim and incluir_nulos:
+            return None
+
+        bordas = LIMITES_FAIXAS_ETARIAS
+        faixas = [
+            codigo
+            for codigo in range(len(FAIXAS_ETARIAS))
+            if (sem_inicio or bordas[codigo] >= inicio)
+            and (sem_fim or bordas[codigo + 1] <= fim + 1)
+        ]
+        mask = np.isin(self.faixa, faixas)
+        # Idades fora das faixas (negativas) só entram sem limite inferior
+        if sem_inicio and (sem_fim or fim >= -1):
+            mask |= (self.faixa < 0) & ~self.idade_nula
+        if incluir_nulos:
+            mask |= self.idade_nula
+        return mask
+
+    def responde_data(
+        self, inicio: pd.Timestamp, fim: pd.Timestamp, limites: tuple
+    ) -> bool:
+        """Se o intervalo de datas cobre períodos inteiros do cubo (sempre, na
+        série diária)"""
+        return self.diario or (
+            (inicio <= limites[0] or inicio.is_month_start)
+            and (fim >= limites[1] or fim.is_month_end)
+        )
+
+    def codigo_periodo(self, data: pd.Timestamp) -> int:
+        """Código do dia ou do mês da data, como nas colunas derivadas"""
+        if self.diario:
+            return (data - pd.Timestamp(0)).days
+        return data.year * 12 + data.month - 1
+
+    def mascara_data(
+        self,
+        inicio: pd.Timestamp,
+        fim: pd.Timestamp,
+        incluir_nulos: bool,
+        limites: tuple,
+    ) -> np.ndarray | None:
+        """Máscara das linhas do cubo no intervalo, que deve respeitar responde_data"""
+        sem_inicio = inicio <= limites[0]
+        sem_fim = fim >= limites[1]
+        if sem_inicio and sem_fim and incluir_nulos:
+            return None
+
+        validos = self.periodo >= 0
+        mask = validos.copy()
+        if not sem_inicio:
+            mask &= self.periodo >= self.codigo_periodo(inicio)
+        if not sem_fim:
+            mask &= self.periodo <= self.codigo_periodo(fim)
+        if incluir_nulos:
+            mask |= ~validos
+        return mask
@@ -0,0 +1,101 @@
+"""Exportação da seleção filtrada em blocos, sem montar o arquivo inteiro em memória.
+
+As linhas são lidas em lotes de tamanho fixo (posições do dataset ou lotes da
+consulta SQL) e cada lote é convertido e enviado antes do próximo ser lido, de
+forma que a memória usada não depende do tamanho do resultado. A conversão de
+cada lote roda numa thread, sem bloquear o laço de eventos das outras sessões.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LINHAS_POR_LOTE = 50_000
+FORMATOS_EXPORTACAO = {"csv": "CSV", "parquet": "Parquet"}
+
+
+def lotes_linhas(
+    df: pd.DataFrame, linhas: np.ndarray, linhas_por_lote: int = LINHAS_POR_LOTE
+) -> Iterator[pd.DataFrame]:
+    """Linhas selecionadas do dataset, materializadas um lote por vez (um lote
+    vazio quando não há linhas, para que o arquivo tenha ao menos o cabeçalho)"""
+    for inicio in range(0, max(len(linhas), 1), linhas_por_lote):
+        yield df.take(linhas[inicio : inicio + linhas_por_lote])
+
+
+def esquema_parquet(df: pd.DataFrame) -> pa.Schema:
+    """Esquema Arrow das colunas do dataset, sem o índice"""
+    return pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+
+
+def blocos_csv(lotes: Iterator[pd.DataFrame]) -> Iterator[str]:
+    """Texto CSV de cada lote, com o cabeçalho só no primeiro, no formato do
+    dataset tratado (separador ";")"""
+    cabecalho = True
+    for lote in lotes:
+        yield lote.to_csv(sep=";", index=False, header=cabecalho)
+        cabecalho = False
+
+
+class _FluxoBlocos:
+    """Arquivo só de escrita que acumula os bytes escritos até serem drenados,
+    para enviar o Parquet à medida que cada grupo de linhas é gravado"""
+
+    def __init__(self):
+        self.blocos = []
+        self.posicao = 0
+        self.closed = False
+
+    def write(self, dados) -> int:
+        dados = bytes(dados)
+        self.blocos.append(dados)
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self) -> int:
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drena(self) -> bytes:
+        dados = b"".join(self.blocos)
+        self.blocos = []
+        return dados
+
+
+def blocos_parquet(
+    lotes: Iterator[pd.DataFrame], esquema: pa.Schema
+) -> Iterator[bytes]:
+    """Bytes de um arquivo Parquet com um grupo de linhas por lote, enviados à
+    medida que cada grupo é gravado (o rodapé vai no último bloco).
+
+    :param lotes: Lotes de linhas exportados
+    :type lotes: Iterator[pd.DataFrame]
+    :param esquema: Esquema do arquivo, fixo para que lotes com colunas só de
+        nulos não mudem os tipos. Cada lote é convertido para ele (textos em
+        categóricas, por exemplo), e o arquivo independe da origem dos lotes
+    :type esquema: pa.Schema
+    """
+    fluxo = _FluxoBlocos()
+    with pq.ParquetWriter(fluxo, esquema) as escritor:
+        for lote in lotes:
+            tabela = pa.Table.from_pandas(lote, preserve_index=False)
+            escritor.write_table(tabela.select(esquema.names).cast(esquema))
+            yield fluxo.drena()
+    yield fluxo.drena()
+
+
+async def em_thread(blocos: Iterator) -> AsyncIterator:
+    """Percorre um iterador de blocos calculando cada um numa thread, para que a
+    exportação não bloqueie as outras sessões"""
+    fim = object()
+    while (bloco := await asyncio.to_thread(next, blocos, fim)) is not fim:
+        yield bloco
@@ -0,0 +1,234 @@
+"""Índices pré-calculados sobre o dataset tratado, usados pelos filtros do dashboard"""
+
+import numpy as np
+import pandas as pd
+
+# Colunas indexadas para os filtros do dashboard
+COLUNAS_INDICE_INVERTIDO = ["racaCor", "sexo", "municipio", "classificacaoFinal"]
+COLUNAS_INDICE_ORDENADO = ["idade", "dataNotificacao"]
+
+
+def tipo_posicao(n_linhas: int) -> type:
+    """Menor tipo inteiro capaz de guardar as posições das linhas"""
+    return np.int32 if n_linhas < np.iinfo(np.int32).max else np.int64
+
+
+class IndiceInvertido:
+    """Índice invertido de uma coluna categórica: para cada valor (incluindo o
+    nulo), as posições das linhas que o contêm.
+
+    As posições ficam agrupadas por valor num único array (como uma matriz
+    esparsa CSR), e `inicios` marca onde começa o grupo de cada valor. O grupo
+    dos nulos é o último.
+
+    :param serie: Coluna indexada
+    :type serie: pd.Series
+    """
+
+    def __init__(self, serie: pd.Series):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy()
+            categorias = serie.cat.categories
+        else:
+            codigos, categorias = pd.factorize(serie)
+
+        self.n_linhas = len(serie)
+        self.codigos = {valor: codigo for codigo, valor in enumerate(categorias)}
+        self.codigo_nulo = len(categorias)
+
+        codigos = np.where(codigos < 0, self.codigo_nulo, codigos)
+        contagens = np.bincount(codigos, minlength=self.codigo_nulo + 1)
+        self.inicios = np.concatenate(([0], np.cumsum(contagens)))
+        self.posicoes = np.argsort(codigos, kind="stable").astype(
+            tipo_posicao(self.n_linhas)
+        )
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Arrays do índice, para gravar junto ao dataset"""
+        return {"inicios": self.inicios, "posicoes": self.posicoes}
+
+    @classmethod
+    def de_arrays(
+        cls, categorias: list, inicios: np.ndarray, posicoes: np.ndarray
+    ) -> "IndiceInvertido":
+        """Índice a partir de arrays gravados (podem estar mapeados em memória)
+
+        :param categorias: Valores da coluna, na ordem dos códigos
+        :type categorias: list
+        :param inicios: Início do grupo de cada código em `posicoes`
+        :type inicios: np.ndarray
+        :param posicoes: Posições das linhas agrupadas por código
+        :type posicoes: np.ndarray
+        """
+        indice = cls.__new__(cls)
+        indice.n_linhas = len(posicoes)
+        indice.codigos = {valor: codigo for codigo, valor in enumerate(categorias)}
+        indice.codigo_nulo = len(categorias)
+        indice.inicios = inicios
+        indice.posicoes = posicoes
+        return indice
+
+    def linhas(self, codigo: int) -> np.ndarray:
+        """Posições das linhas com o código informado"""
+        return self.posicoes[self.inicios[codigo] : self.inicios[codigo + 1]]
+
+    def mascara(self, valores: list, incluir_nulos: bool = False) -> np.ndarray | None:
+        """Máscara das linhas com qualquer um dos valores (união dentro da dimensão).
+
+        :param valores: Valores selecionados
+        :type valores: list
+        :param incluir_nulos: Se as linhas nulas também são selecionadas, defaults to False
+        :type incluir_nulos: bool, optional
+        :return: Máscara booleana, ou None se a seleção cobre todas as linhas
+        :rtype: np.ndarray | None
+        """
+        codigos = {self.codigos[v] for v in valores if v in self.codigos}
+        if incluir_nulos:
+            codigos.add(self.codigo_nulo)
+
+        total = sum(self.inicios[c + 1] - self.inicios[c] for c in codigos)
+        if total == self.n_linhas:
+            return None
+
+        mask = np.zeros(self.n_linhas, dtype=bool)
+        for codigo in codigos:
+            mask[self.linhas(codigo)] = True
+        return mask
+
+
+class IndiceOrdenado:
+    """Ordenação pré-calculada de uma coluna numérica ou de datas, para resolver
+    filtros de intervalo por busca binária.
+
+    Os valores não nulos ficam ordenados junto com suas posições, então um
+    intervalo é uma fatia contígua encontrada com searchsorted. As linhas nulas
+    ficam guardadas à parte para os switches de "permitir nulas".
+
+    :param serie: Coluna indexada
+    :type serie: pd.Series
+    """
+
+    def __init__(self, serie: pd.Series):
+        self.n_linhas = len(serie)
+        tipo = tipo_posicao(self.n_linhas)
+
+        nulos = serie.isna().to_numpy()
+        if hasattr(serie.dtype, "numpy_dtype"):
+            # Inteiros anuláveis: os nulos são descartados logo abaixo
+            valores = serie.to_numpy(dtype=serie.dtype.numpy_dtype, na_value=0)
+        else:
+            valores = serie.to_numpy()
+
+        validos = np.flatnonzero(~nulos)
+        ordem = validos[np.argsort(valores[validos], kind="stable")]
+        self.valores_ordenados = valores[ordem]
+        self.posicoes = ordem.astype(tipo)
+        self.nulos = np.flatnonzero(nulos).astype(tipo)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Arrays do índice, para gravar junto ao dataset"""
+        return {
+            "valores_ordenados": self.valores_ordenados,
+            "posicoes": self.posicoes,
+            "nulos": self.nulos,
+        }
+
+    @classmethod
+    def de_arrays(
+        cls, valores_ordenados: np.ndarray, posicoes: np.ndarray, nulos: np.ndarray
+    ) -> "IndiceOrdenado":
+        """Índice a partir de arrays gravados (podem estar mapeados em memória)"""
+        indice = cls.__new__(cls)
+        indice.n_linhas = len(posicoes) + len(nulos)
+        indice.valores_ordenados = valores_ordenados
+        indice.posicoes = posicoes
+        indice.nulos = nulos
+        return indice
+
+    def intervalo(self, inicio, fim) -> np.ndarray:
+        """Posições das linhas com inicio <= valor <= fim, em O(log n) mais o tamanho da saída"""
+        a = np.searchsorted(self.valores_ordenados, inicio, side="left")
+        b = np.searchsorted(self.valores_ordenados, fim, side="right")
+        return self.posicoes[a:b]
+
+    def mascara(self, inicio, fim, incluir_nulos: bool = False) -> np.ndarray | None:
+        """Máscara das linhas no intervalo fechado [inicio, fim].
+
+        :param inicio: Limite inferior
+        :param fim: Limite superior
+        :param incluir_nulos: Se as linhas nulas também são selecionadas, defaults to False
+        :type incluir_nulos: bool, optional
+        :return: Máscara booleana, ou None se o intervalo cobre todas as linhas
+        :rtype: np.ndarray | None
+        """
+        linhas = self.intervalo(inicio, fim)
+        total = len(linhas) + (len(self.nulos) if incluir_nulos else 0)
+        if total == self.n_linhas:
+            return None
+
+        mask = np.zeros(self.n_linhas, dtype=bool)
+        mask[linhas] = True
+        if incluir_nulos:
+            mask[self.nulos] = True
+        return mask
+
+
+class OrdenacoesTabela:
+    """Permutações que ordenam o dataset por cada coluna, para paginar a tabela
+    já ordenada sem reordenar as linhas filtradas a cada página.
+
+    Cada permutação é calculada na primeira vez que a coluna é ordenada e
+    reaproveitada por todas as sessões. Os nulos ficam por último nas duas
+    direções.
+
+    :param df: Dataset ordenado
+    :type df: pd.DataFrame
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n_linhas = len(df)
+        self.permutacoes = {}
+
+    def permutacao(self, coluna: str, decrescente: bool = False) -> np.ndarray:
+        """Posições de todas as linhas do dataset na ordem da coluna"""
+        chave = (coluna, decrescente)
+        if chave not in self.permutacoes:
+            serie = self.df[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype) and not serie.cat.ordered:
+                # Pelos valores, e não pela ordem em que as categorias surgiram
+                serie = serie.cat.reorder_categories(sorted(serie.cat.categories))
+            # Códigos na ordem dos valores, -1 para nulos
+            codigos, valores = pd.factorize(serie, sort=True)
+            n = len(valores)
+            codigos = np.where(
+                codigos < 0, n, n - 1 - codigos if decrescente else codigos
+            )
+            permutacao = np.argsort(codigos, kind="stable").astype(
+                tipo_posicao(self.n_linhas)
+            )
+            permutacao.setflags(write=False)
+            self.permutacoes[chave] = permutacao
+        return self.permutacoes[chave]
+
+    def ordena(
+        self, linhas: np.ndarray, coluna: str, decrescente: bool = False
+    ) -> np.ndarray:
+        """Linhas selecionadas na ordem da coluna, filtrando a permutação
+        pré-calculada em O(n) em vez de ordenar a seleção.
+
+        :param linhas: Posições selecionadas no dataset
+        :type linhas: np.ndarray
+        :param coluna: Coluna da ordenação
+        :type coluna: str
+        :param decrescente: Se a ordem é decrescente, defaults to False
+        :type decrescente: bool, optional
+        :return: Posições selecionadas, ordenadas
+        :rtype: np.ndarray
+        """
+        permutacao = self.permutacao(coluna, decrescente)
+        if len(linhas) == self.n_linhas:
+            return permutacao
+        selecionadas = np.zeros(self.n_linhas, dtype=bool)
+        selecionadas[linhas] = True
+        return permutacao[selecionadas[permutacao]]
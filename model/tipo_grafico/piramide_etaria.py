@@ -2,11 +2,11 @@
 
 import math
 
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 
-from model.tipo_grafico.barra import GraficoBarra
 from model.grafico import Grafico
 import locale
 import platform
@@ -25,30 +25,58 @@ except locale.Error as e:
 
 
 class GraficoPiramideEtaria(Grafico):
-    """Cria um gráfico de pirâmide etária com duas barras.
-
-    :param grafico_esquerda: Gráfico de barra da esquerda
-    :type grafico_esquerda: GraficoBarra
-    :param grafico_direita: Gráfico de barra da esquerda
-    :type grafico_direita: GraficoBarra
-    :param valor_maximo: Valor máximo da coluna
-    :type valor_maximo: int
+    """Cria um gráfico de pirâmide etária com duas barras, direto dos arrays de contagem.
+
+    :param faixas: Rótulos das faixas etárias (eixo y)
+    :type faixas: list[str]
+    :param valores_esquerda: Contagem de cada faixa na barra da esquerda
+    :type valores_esquerda: np.ndarray
+    :param valores_direita: Contagem de cada faixa na barra da direita
+    :type valores_direita: np.ndarray
+    :param nome_esquerda: Nome da barra da esquerda na legenda e no hover, defaults to ""
+    :type nome_esquerda: str, optional
+    :param nome_direita: Nome da barra da direita na legenda e no hover, defaults to ""
+    :type nome_direita: str, optional
+    :param cor_esquerda: Codigo Hex da cor da barra da esquerda, defaults to None
+    :type cor_esquerda: str, optional
+    :param cor_direita: Codigo Hex da cor da barra da direita, defaults to None
+    :type cor_direita: str, optional
     """
 
     def __init__(
         self,
-        grafico_esquerda: GraficoBarra,
-        grafico_direita: GraficoBarra,
-        valor_maximo: int,
+        faixas: list[str],
+        valores_esquerda: np.ndarray,
+        valores_direita: np.ndarray,
+        nome_esquerda: str = "",
+        nome_direita: str = "",
+        cor_esquerda: str | None = None,
+        cor_direita: str | None = None,
     ):
 
         self.grafico = go.Figure()
 
-        grafico_esquerda = grafico_esquerda.get_grafico_figure()
-        grafico_direita = grafico_direita.get_grafico_figure()
-
-        self.grafico.add_traces(grafico_esquerda.data)
-        self.grafico.add_traces(grafico_direita.data)
+        # A barra da esquerda é desenhada com valores negativos; o hover mostra
+        # a contagem original
+        for valores, sinal, nome, cor in (
+            (valores_esquerda, -1, nome_esquerda, cor_esquerda),
+            (valores_direita, 1, nome_direita, cor_direita),
+        ):
+            self.grafico.add_trace(
+                go.Bar(
+                    x=sinal * valores,
+                    y=faixas,
+                    orientation="h",
+                    name=nome,
+                    marker_color=cor,
+                    customdata=valores,
+                    hovertemplate=f"<b>%{{y}}</b><br>{nome}: %{{customdata:,}}<extra></extra>",
+                    textposition="inside",
+                    showlegend=True,
+                )
+            )
+
+        valor_maximo = max(np.max(valores_esquerda), np.max(valores_direita))
 
         # Tickvals
         step_approx = 1000 * math.ceil(valor_maximo / 1000) / 4
@@ -9,53 +9,108 @@ from model.tipo_grafico.barra import GraficoBarra
 from model.tipo_grafico.linha import GraficoLinha
 from model.tipo_grafico.piramide_etaria import GraficoPiramideEtaria
 from model.tipo_grafico.donut import GraficoDonut
-from shared import df_tratado
+from shared import (
+    backend_sql,
+    cubo_dados,
+    df_tratado,
+    dominio_filtros,
+    esquema_exportacao,
+    indices_categoricos,
+    indices_ordenados,
+    matriz_sintomas,
+    ordenacoes_tabela,
+    serie_dados,
+)
+from colunas_derivadas import FAIXAS_ETARIAS, GRANULARIDADES
+from cache_filtros import CacheFiltros
+from exportacao import (
+    LINHAS_POR_LOTE,
+    blocos_csv,
+    blocos_parquet,
+    em_thread,
+    lotes_linhas,
+)
+from cubo import CuboDados
+from agregacao import Selecao, contagem_2d, contagens_categoricas, tabela_cruzada
+from tratamento_dado import SINTOMAS
 
 import pandas as pd
 
-idade_range = (
-    df_tratado["idade"].min().item(),
-    df_tratado["idade"].max().item(),
-)
-raca_cor_lista = df_tratado["racaCor"].fillna("nan").astype(str).unique().tolist()
-sexo_lista = df_tratado["sexo"].fillna("nan").astype(str).unique().tolist()
-data_range = (
-    df_tratado["dataNotificacao"].min(),
-    df_tratado["dataNotificacao"].max(),
-)
+idade_range = dominio_filtros["idade"]
+raca_cor_lista = [str(valor) for valor in dominio_filtros["racaCor"]]
+sexo_lista = [str(valor) for valor in dominio_filtros["sexo"]]
+data_range = dominio_filtros["dataNotificacao"]
+# Seleções de linhas e agregados por estado de filtro, compartilhados entre sessões
+cache_filtros = CacheFiltros()
+# Linhas por página da tabela
+LINHAS_TABELA = 500
 
 
 def server(input, output, session):
 
+    # Uma máscara memoizada por dimensão de filtro: quando um único controle
+    # muda, só a máscara dele é recalculada antes de recombinar.
+    # Intervalos são resolvidos por busca binária nos índices ordenados e as
+    # categóricas pela união dos valores nos índices invertidos.
+    # None indica que a dimensão não restringe nada
     @reactive.calc
-    def df_filtrado():
-        df = df_tratado.copy()
-
-        # Idade
+    def mascara_idade():
         idade = input.idade()
-        # Se permitir nulas
-        if input.permite_nulas_idade():
-            df = df[df["idade"].between(idade[0], idade[1]) | df["idade"].isna()]
-        else:
-            df = df[df["idade"].between(idade[0], idade[1])]
+        return indices_ordenados["idade"].mascara(
+            idade[0], idade[1], incluir_nulos=input.permite_nulas_idade()
+        )
 
-        # Data
+    @reactive.calc
+    def mascara_data():
         inicio, fim = input.data()
-        mask_intervalo = (df["dataNotificacao"] >= pd.to_datetime(inicio)) & (
-            df["dataNotificacao"] <= pd.to_datetime(fim)
+        return indices_ordenados["dataNotificacao"].mascara(
+            pd.to_datetime(inicio).to_datetime64(),
+            pd.to_datetime(fim).to_datetime64(),
+            incluir_nulos=input.permite_nulas_data(),
         )
 
-        if input.permite_nulas_data():
-            df = df[mask_intervalo | df["dataNotificacao"].isna()]
-        else:
-            df = df[mask_intervalo]
+    @reactive.calc
+    def mascara_raca_cor():
+        return mascara_com_nan(indices_categoricos, "racaCor", input.racaCor())
 
-        df = filtro_com_nan(df, "racaCor", input.racaCor)
-        df = filtro_com_nan(df, "sexo", input.sexo)
-        df = filtro_selectize(df, "municipio", input.municipio)
-        df = filtro_selectize(df, "classificacaoFinal", input.classificacaoFinal)
+    @reactive.calc
+    def mascara_sexo():
+        return mascara_com_nan(indices_categoricos, "sexo", input.sexo())
 
-        return df
+    @reactive.calc
+    def mascara_municipio():
+        return mascara_selectize(indices_categoricos, "municipio", input.municipio())
+
+    @reactive.calc
+    def mascara_classificacao_final():
+        return mascara_selectize(
+            indices_categoricos, "classificacaoFinal", input.classificacaoFinal()
+        )
+
+    def calcula_linhas_filtradas():
+        """Posições em df_tratado das linhas que passam em todos os filtros.
+
+        Os filtros são compostos numa única máscara booleana sobre o dataset
+        base, sem criar DataFrames intermediários.
+        """
+        mask = combina_mascaras(
+            mascara()
+            for mascara in (
+                mascara_idade,
+                mascara_data,
+                mascara_raca_cor,
+                mascara_sexo,
+                mascara_municipio,
+                mascara_classificacao_final,
+            )
+        )
+        if mask is None:
+            return np.arange(len(df_tratado))
+        return np.flatnonzero(mask)
+
+    @reactive.calc
+    def linhas_filtradas():
+        return cache_filtros.obtem(chave_filtro(), "linhas", calcula_linhas_filtradas)
 
     @reactive.effect
     @reactive.event(input.reset)
@@ -76,91 +131,154 @@ def server(input, output, session):
         ui.update_selectize("municipio", selected=[])
         ui.update_selectize("classificacaoFinal", selected=[])
 
+    @reactive.calc
+    def chave_filtro():
+        """Forma canônica do estado dos filtros, chave do cache entre sessões"""
+        return normaliza_filtro(
+            input.idade(),
+            input.permite_nulas_idade(),
+            input.data(),
+            input.permite_nulas_data(),
+            input.racaCor(),
+            input.sexo(),
+            input.municipio(),
+            input.classificacaoFinal(),
+        )
+
+    @reactive.calc
+    def selecao():
+        """Base sobre a qual os gráficos são agregados: a fatia do cubo quando o
+        estado dos filtros é respondível por ele, senão as células agregadas
+        pela consulta SQL ou, no backend pandas, as linhas filtradas do dataset
+        (peso 1)"""
+        chave = chave_filtro()
+        linhas = cache_filtros.obtem(
+            chave, "linhas_cubo", lambda: linhas_cubo(cubo_dados, chave)
+        )
+        if linhas is not None:
+            return Selecao(cubo_dados.cubo, linhas, "contagem", cubo_dados.matrizes)
+        if backend_sql is not None:
+            celulas = cache_filtros.obtem(
+                chave, "celulas_sql", lambda: backend_sql.agrega(chave)
+            )
+            return Selecao(celulas, peso="contagem")
+        return Selecao(
+            df_tratado, linhas_filtradas(), matrizes={"sintomas": matriz_sintomas}
+        )
+
+    def agregado_vetorizado(nome: str, funcao):
+        """Agregado `nome` do resultado filtrado, calculado pela função sobre os
+        códigos da seleção, sem materializar o DataFrame filtrado, e
+        reaproveitado do cache quando outra sessão já calculou para o mesmo
+        estado de filtros"""
+        return cache_filtros.obtem(chave_filtro(), nome, lambda: funcao(selecao()))
+
+    @reactive.calc
+    def indicadores():
+        """Contagens dos três value boxes, calculadas numa única passada"""
+        return agregado_vetorizado("indicadores", agrega_indicadores)
+
     @render.ui
     def numero_notificacoes():
-        return len(df_filtrado())
+        return indicadores()["total"]
 
     @render.ui
     def porcentagem_notificacoes_positivas():
-        df = df_filtrado()
-        positivos = len(df[df["classificacaoFinalSimplificado"] == 1])
+        kpi = indicadores()
+        # Seleção vazia: não há porcentagem a mostrar
+        if not kpi["total"]:
+            return "–"
 
-        return f"{positivos / len(df_filtrado()) * 100:.2f}%"
+        return f"{kpi['positivos'] / kpi['total'] * 100:.2f}%"
 
     @render.ui
     def idade_media():
-        df = df_filtrado()
-
-        return f"{df["idade"].mean():.0f}"
+        kpi = indicadores()
+        # Seleção vazia ou só com idades nulas: não há média a mostrar
+        if not kpi["idade_contagem"]:
+            return "–"
 
-    @render.data_frame
-    def table():
-        return render.DataGrid(df_filtrado().head(500))
+        return f"{kpi['idade_soma'] / kpi['idade_contagem']:.0f}"
 
     @reactive.calc
-    def processa_piramide_etaria():
-        df = df_filtrado().copy()
-
-        # Criar faixa etária
-        bins = [0, 18, 30, 40, 50, 60, 70, 80, 90, 100, np.inf]
-        labels = [
-            "<18",
-            "18-29",
-            "30-39",
-            "40-49",
-            "50-59",
-            "60-69",
-            "70-79",
-            "80-89",
-            "90-99",
-            "100+",
-        ]
-
-        df["age_range"] = pd.cut(df["idade"], bins=bins, labels=labels, right=False)
-
-        # Contagem de casos
-        df_group = (
-            df.groupby(["sexo", "age_range"]).size().reset_index(name="total_admissoes")
+    def linhas_ordenadas():
+        """Posições das linhas filtradas na ordem escolhida para a tabela"""
+        coluna = input.ordem_tabela()
+        if not coluna:
+            return linhas_filtradas()
+        decrescente = input.ordem_decrescente()
+        return cache_filtros.obtem(
+            chave_filtro(),
+            f"ordem_{coluna}_{decrescente}",
+            lambda: ordenacoes_tabela.ordena(linhas_filtradas(), coluna, decrescente),
         )
 
-        # Separar masculino e feminino
-        df_masculino = df_group[df_group["sexo"] == "Masculino"].copy()
-        df_feminino = df_group[df_group["sexo"] == "Feminino"].copy()
+    @reactive.calc
+    def pagina_tabela():
+        """Número de linhas filtradas, de páginas e intervalo [inicio, fim) da
+        página atual"""
+        total = indicadores()["total"]
+        paginas = max(1, -(-total // LINHAS_TABELA))
+        pagina = min(max(int(input.pagina_tabela() or 1), 1), paginas)
+        inicio = (pagina - 1) * LINHAS_TABELA
+        return total, paginas, inicio, min(inicio + LINHAS_TABELA, total)
 
-        df_masculino["total_admissoes_abs"] = df_masculino["total_admissoes"]
-        df_masculino["total_admissoes"] *= -1  # para pirâmide
+    @render.data_frame
+    def table():
+        # Só a página visível vai para o navegador
+        _, _, inicio, fim = pagina_tabela()
+        if backend_sql is not None:
+            return render.DataGrid(
+                backend_sql.filtra(
+                    chave_filtro(),
+                    fim - inicio,
+                    inicio,
+                    input.ordem_tabela() or None,
+                    input.ordem_decrescente(),
+                )
+            )
+        return render.DataGrid(df_tratado.take(linhas_ordenadas()[inicio:fim]))
+
+    @render.text
+    def paginacao_tabela():
+        total, paginas, inicio, fim = pagina_tabela()
+        return (
+            f"Linhas {min(inicio + 1, total):,} a {fim:,} de {total:,} "
+            f"(página {inicio // LINHAS_TABELA + 1} de {paginas})"
+        )
 
-        ordem_idades = labels  # já definidas acima
+    @render.download(
+        filename=lambda: f"notificacoes_filtradas.{input.formato_exportacao()}"
+    )
+    async def exporta_dados():
+        # Lê a seleção antes de começar: o envio dos blocos pode seguir enquanto
+        # os filtros mudam
+        if backend_sql is not None:
+            lotes = backend_sql.lotes(chave_filtro(), LINHAS_POR_LOTE)
+        else:
+            lotes = lotes_linhas(df_tratado, linhas_filtradas())
 
-        # Criar gráficos
-        plot_1 = GraficoBarra(
-            dataframe=df_masculino,
-            eixo_x="total_admissoes",
-            eixo_y="age_range",
-            hex_cores=["#4B6BD5"],
-            ordem={"age_range": ordem_idades},
-            data_custom_hover=["total_admissoes_abs"],
-        )
-        plot_1.set_hover("<b>%{y}</b><br>Masculino: %{customdata[0]:,}<extra></extra>")
-        plot_1.set_nome("Masculino")
-
-        plot_2 = GraficoBarra(
-            dataframe=df_feminino,
-            eixo_x="total_admissoes",
-            eixo_y="age_range",
-            hex_cores=["#E91E63"],
-            ordem={"age_range": ordem_idades},
-        )
-        plot_2.set_hover("<b>%{y}</b><br>Feminimo: %{customdata[0]:,}<extra></extra>")
-        plot_2.set_nome("Feminino")
+        if input.formato_exportacao() == "parquet":
+            blocos = blocos_parquet(lotes, esquema_exportacao)
+        else:
+            blocos = blocos_csv(lotes)
+        async for bloco in em_thread(blocos):
+            yield bloco
 
-        valor_maximo = max(
-            abs(df_masculino["total_admissoes"].min()),
-            df_feminino["total_admissoes"].max(),
+    @reactive.calc
+    def processa_piramide_etaria():
+        masculino, feminino = agregado_vetorizado("piramide", agrega_piramide)
+
+        fig = GraficoPiramideEtaria(
+            FAIXAS_ETARIAS,
+            masculino,
+            feminino,
+            nome_esquerda="Masculino",
+            nome_direita="Feminino",
+            cor_esquerda="#4B6BD5",
+            cor_direita="#E91E63",
         )
-
-        fig = GraficoPiramideEtaria(plot_1, plot_2, valor_maximo)
-        fig.set_ordem(ordem_idades)
+        fig.set_ordem(FAIXAS_ETARIAS)
 
         return fig
 
@@ -169,13 +287,18 @@ def server(input, output, session):
         return processa_piramide_etaria().get_grafico_figure()
 
     @reactive.calc
-    def processa_donut_sexo():
-        df = df_filtrado().copy()
-
-        df_pizza = (
-            df["sexo"].fillna("Não informado").astype(str).value_counts().reset_index()
+    def contagens_donuts():
+        """Contagens por valor das três dimensões dos donuts, numa única etapa"""
+        return agregado_vetorizado(
+            "contagens_donuts",
+            lambda selecao: contagens_categoricas(
+                selecao, ["sexo", "racaCor", "classificacaoRotulo"]
+            ),
         )
-        df_pizza.columns = ["sexo", "total"]
+
+    @reactive.calc
+    def processa_donut_sexo():
+        df_pizza = tabela_donut(contagens_donuts()["sexo"], "sexo")
 
         grafico = GraficoDonut(
             dataframe=df_pizza,
@@ -192,16 +315,7 @@ def server(input, output, session):
 
     @reactive.calc
     def processa_donut_raca():
-        df = df_filtrado().copy()
-
-        df_pizza = (
-            df["racaCor"]
-            .fillna("Não informado")
-            .astype(str)
-            .value_counts()
-            .reset_index()
-        )
-        df_pizza.columns = ["raca_cor", "total"]
+        df_pizza = tabela_donut(contagens_donuts()["racaCor"], "raca_cor")
 
         grafico = GraficoDonut(
             dataframe=df_pizza,
@@ -218,19 +332,12 @@ def server(input, output, session):
 
     @reactive.calc
     def processa_donut_classificacao():
-        df = df_filtrado().copy()
-
-        df["classificacao_label"] = df["classificacaoFinalSimplificado"].map(
-            {
-                1: "Confirmado",
-                0: "Negativo",
-            }
+        df_pizza = tabela_donut(
+            contagens_donuts()["classificacaoRotulo"],
+            "classificacao_label",
+            ordena=False,
         )
 
-        df["classificacao_label"] = df["classificacao_label"].fillna("Não informado")
-
-        df_pizza = df.groupby("classificacao_label").size().reset_index(name="total")
-
         grafico = GraficoDonut(
             dataframe=df_pizza,
             hole=0.5,
@@ -245,23 +352,42 @@ def server(input, output, session):
     def donut_classificacao():
         return processa_donut_classificacao()
 
-    @render_widget
-    def grafico_numero_casos():
-        df = df_filtrado()
-
-        df["ano"] = df["dataNotificacao"].dt.year
-        df["mes"] = df["dataNotificacao"].dt.month
+    def calcula_serie_diaria(chave: tuple) -> pd.DataFrame:
+        linhas = linhas_cubo(serie_dados, chave)
+        if linhas is not None:
+            selecao_serie = Selecao(serie_dados.cubo, linhas, "contagem")
+        elif backend_sql is not None:
+            celulas = backend_sql.agrega(
+                chave, ["diaNotificacao", "classificacaoFinal"], ["contagem"]
+            )
+            selecao_serie = Selecao(celulas, peso="contagem")
+        else:
+            # Só os códigos das duas colunas nas linhas filtradas são lidos
+            selecao_serie = Selecao(df_tratado, linhas_filtradas())
+        return agrega_serie_diaria(selecao_serie)
 
-        df["ano_mes"] = df["dataNotificacao"].dt.to_period("M")
+    @reactive.calc
+    def serie_diaria():
+        """Casos por dia e classificação, de onde saem todas as granularidades"""
+        chave = chave_filtro()
+        return cache_filtros.obtem(
+            chave, "serie_diaria", lambda: calcula_serie_diaria(chave)
+        )
 
-        df_agrupado = df.groupby("ano_mes").size().reset_index(name="num_casos")
+    @reactive.calc
+    def serie():
+        """Série temporal compartilhada pelos dois gráficos de linha, na
+        granularidade escolhida: trocar de granularidade só reagrupa a série
+        diária já calculada"""
+        return reagrupa_serie(serie_diaria(), input.granularidade())
 
-        df_agrupado = df_agrupado.sort_values("ano_mes")
-        df_agrupado["ano_mes_str"] = df_agrupado["ano_mes"].astype(str)
+    @render_widget
+    def grafico_numero_casos():
+        df_agrupado = casos_periodo(serie())
 
         plot = GraficoLinha(
             df_agrupado,
-            "ano_mes_str",
+            "periodo_str",
             "num_casos",
         )
 
@@ -269,24 +395,11 @@ def server(input, output, session):
 
     @render_widget
     def grafico_linha_classificacao():
-        df = df_filtrado().copy()
-
-        df["ano"] = df["dataNotificacao"].dt.year
-        df["mes"] = df["dataNotificacao"].dt.month
-
-        df["ano_mes"] = df["dataNotificacao"].dt.to_period("M")
+        df_agrupado = classificacao_periodo(serie())
 
-        df_agrupado = (
-            df.groupby(["ano_mes", "classificacaoFinal"])
-            .size()
-            .reset_index(name="num_casos")
-        )
-
-        df_agrupado = df_agrupado.sort_values("ano_mes")
-        df_agrupado["ano_mes_str"] = df_agrupado["ano_mes"].astype(str)
         plot = GraficoLinha(
             df_agrupado,
-            eixo_x="ano_mes_str",
+            eixo_x="periodo_str",
             eixo_y="num_casos",
             cor="classificacaoFinal",
         )
@@ -295,26 +408,7 @@ def server(input, output, session):
 
     @render_widget
     def grafico_sintomas():
-        df = df_filtrado()
-
-        df = df[
-            [
-                "distúrbios olfativos",
-                "distúrbios gustativos",
-                "outros",
-                "dor de garganta",
-                "dor de cabeça",
-                "dispneia",
-                "febre",
-                "tosse",
-                "coriza",
-                "dificuldade de respirar",
-            ]
-        ]
-
-        df_sintomas = (
-            df.sum(axis=0).sort_values(ascending=False).reset_index(name="contagem")
-        )
+        df_sintomas = agregado_vetorizado("sintomas", agrega_sintomas)
 
         fig = GraficoBarra(
             dataframe=df_sintomas,
@@ -327,27 +421,10 @@ def server(input, output, session):
 
     @render_widget
     def grafico_num_sintomas_classificacao_final():
-        df = df_filtrado()
-
-        df["classificacao_label"] = df["classificacaoFinalSimplificado"].map(
-            {
-                1: "Confirmado",
-                0: "Negativo",
-            }
-        )
-
-        df = (
-            df.groupby(["numSintomas", "classificacao_label"])
-            .size()
-            .reset_index(name="contagem")
+        df = agregado_vetorizado(
+            "num_sintomas_classificacao", agrega_num_sintomas_classificacao
         )
 
-        df["percentual"] = (
-            df["contagem"] / df.groupby("numSintomas")["contagem"].transform("sum")
-        ) * 100
-
-        print(df)
-
         fig = GraficoBarra(
             dataframe=df,
             eixo_x="percentual",
@@ -363,15 +440,252 @@ def server(input, output, session):
         return fig.get_grafico_figure()
 
 
-def filtro_selectize(df, coluna: str, input):
-    if len(input()) > 0:
-        df = df[df[coluna].isin(input())]
-    return df
-
-
-def filtro_com_nan(df: pd.DataFrame, coluna: str, input):
-    if "nan" in input():
-        df = df[df[coluna].isin(input()) | df[coluna].isna()]
-    else:
-        df = df[df[coluna].isin(input())]
-    return df
+def normaliza_filtro(
+    idade: tuple,
+    permite_nulas_idade: bool,
+    data: tuple,
+    permite_nulas_data: bool,
+    raca_cor: list,
+    sexo: list,
+    municipio: list,
+    classificacao_final: list,
+) -> tuple:
+    """Forma canônica do estado dos filtros: seleções ordenadas e intervalos
+    limitados à faixa existente nos dados, para que estados equivalentes
+    compartilhem a mesma entrada do cache"""
+    idade_min = max(idade[0], idade_range[0])
+    idade_max = min(idade[1], idade_range[1])
+    data_min = max(pd.to_datetime(data[0]), data_range[0])
+    data_max = min(pd.to_datetime(data[1]), data_range[1])
+
+    return (
+        (idade_min, idade_max, bool(permite_nulas_idade)),
+        (data_min.isoformat(), data_max.isoformat(), bool(permite_nulas_data)),
+        tuple(sorted(map(str, raca_cor))),
+        tuple(sorted(map(str, sexo))),
+        tuple(sorted(map(str, municipio))),
+        tuple(sorted(map(str, classificacao_final))),
+    )
+
+
+def linhas_cubo(cubo: CuboDados | None, chave: tuple) -> np.ndarray | None:
+    """Posições no cubo das células selecionadas pelo estado dos filtros.
+
+    :param cubo: Cubo principal ou série diária
+    :type cubo: CuboDados | None
+    :param chave: Forma canônica do estado dos filtros (normaliza_filtro)
+    :type chave: tuple
+    :return: Posições das células, ou None se não há cubo ou se os intervalos
+        de idade e data não se alinham às faixas etárias e aos períodos do cubo
+    :rtype: np.ndarray | None
+    """
+    if cubo is None:
+        return None
+
+    (
+        (idade_min, idade_max, nulas_idade),
+        (data_min, data_max, nulas_data),
+        raca_cor,
+        sexo,
+        municipio,
+        classificacao_final,
+    ) = chave
+    data_min, data_max = pd.Timestamp(data_min), pd.Timestamp(data_max)
+    if not (
+        cubo.responde_idade(idade_min, idade_max, idade_range)
+        and cubo.responde_data(data_min, data_max, data_range)
+    ):
+        return None
+
+    indices = cubo.indices
+    mask = combina_mascaras(
+        [
+            cubo.mascara_idade(idade_min, idade_max, nulas_idade, idade_range),
+            cubo.mascara_data(data_min, data_max, nulas_data, data_range),
+            mascara_com_nan(indices, "racaCor", raca_cor),
+            mascara_com_nan(indices, "sexo", sexo),
+            mascara_selectize(indices, "municipio", municipio),
+            mascara_selectize(indices, "classificacaoFinal", classificacao_final),
+        ]
+    )
+    if mask is None:
+        return np.arange(len(cubo.cubo))
+    return np.flatnonzero(mask)
+
+
+# As agregações recebem linhas do dataset (peso None, cada linha conta 1) ou
+# células do cubo (peso "contagem", cada célula conta o número de notificações
+# que resume) e produzem o mesmo resultado nos dois casos
+
+
+def agrega_indicadores(selecao: Selecao) -> dict[str, int]:
+    """Número de notificações, de positivas, de idades informadas e soma das
+    idades, lidos direto das colunas nas linhas selecionadas (no cubo, das
+    medidas pré-agregadas de cada célula)"""
+    positivo = selecao.coluna("classificacaoFinalSimplificado") == 1
+
+    if selecao.peso is None:
+        idade = selecao.base["idade"].array
+        if selecao.linhas is not None:
+            idade = idade[selecao.linhas]
+        informada = ~np.asarray(idade.isna())
+        valores = idade.to_numpy(dtype=np.int64, na_value=0)
+        return {
+            "total": len(selecao),
+            "positivos": int(np.count_nonzero(positivo)),
+            "idade_contagem": int(np.count_nonzero(informada)),
+            "idade_soma": int(valores.sum()),
+        }
+
+    pesos = selecao.pesos()
+    return {
+        "total": int(pesos.sum()),
+        "positivos": int(pesos[positivo].sum()),
+        "idade_contagem": int(selecao.coluna("idade_contagem").sum()),
+        "idade_soma": int(selecao.coluna("idade_soma").sum()),
+    }
+
+
+def agrega_piramide(selecao: Selecao) -> tuple[np.ndarray, np.ndarray]:
+    """Contagem de casos por faixa etária (código calculado na ingestão) para
+    o sexo masculino e para o feminino, num único bincount sobre sexo × faixa"""
+    sexo, sexos = selecao.codigos("sexo")
+    faixa, _ = selecao.codigos("faixaEtaria")
+    contagens = contagem_2d(
+        sexo, len(sexos), faixa, len(FAIXAS_ETARIAS), selecao.pesos()
+    )
+
+    def por_faixa(rotulo: str) -> np.ndarray:
+        if rotulo not in sexos:
+            return np.zeros(len(FAIXAS_ETARIAS), dtype=np.int64)
+        return contagens[sexos.index(rotulo)]
+
+    return por_faixa("Masculino"), por_faixa("Feminino")
+
+
+def tabela_donut(contagens: pd.Series, nome: str, ordena: bool = True) -> pd.DataFrame:
+    """Valores com contagem positiva, do mais para o menos frequente (ou na
+    ordem das categorias), como DataFrame [nome, total] para o GraficoDonut"""
+    contagens = contagens[contagens > 0]
+    if ordena:
+        contagens = contagens.sort_values(ascending=False, kind="stable")
+
+    df_pizza = contagens.reset_index()
+    df_pizza.columns = [nome, "total"]
+    return df_pizza
+
+
+def agrega_serie_diaria(selecao: Selecao) -> pd.DataFrame:
+    """Contagem de casos por dia (código inteiro calculado na ingestão) e
+    classificação final, com as classificações nulas num grupo próprio para
+    que a soma de cada período seja o total de casos.
+
+    Um único np.bincount 2-D sobre os códigos de dia e de classificação, sem
+    materializar as linhas selecionadas; só as combinações presentes entram no
+    resultado, ordenadas por dia e classificação (nulos por último)."""
+    dias = selecao.coluna("diaNotificacao")
+    classificacoes, categorias = selecao.codigos("classificacaoFinal")
+    pesos = selecao.pesos()
+
+    validos = dias >= 0
+    dias, classificacoes = dias[validos], classificacoes[validos]
+    pesos = None if pesos is None else pesos[validos]
+
+    # Nulos com código próprio, logo após a última categoria
+    n = len(categorias)
+    classificacoes = np.where(classificacoes < 0, n, classificacoes)
+    inicio = int(dias.min()) if len(dias) else 0
+    n_dias = int(dias.max()) - inicio + 1 if len(dias) else 0
+    contagens = contagem_2d(dias - inicio, n_dias, classificacoes, n + 1, pesos)
+
+    i, j = np.nonzero(contagens)
+    return pd.DataFrame(
+        {
+            "diaNotificacao": (i + inicio).astype(np.int32),
+            "classificacaoFinal": pd.Categorical.from_codes(
+                np.where(j == n, -1, j), categories=categorias
+            ),
+            "num_casos": contagens[i, j],
+        }
+    )
+
+
+def reagrupa_serie(serie_diaria: pd.DataFrame, granularidade: str) -> pd.DataFrame:
+    """Soma a série diária por dia, semana epidemiológica ou mês"""
+    codigo, rotulo = GRANULARIDADES[granularidade]
+    serie = (
+        serie_diaria.assign(periodo=codigo(serie_diaria["diaNotificacao"].to_numpy()))
+        .groupby(["periodo", "classificacaoFinal"], observed=True, dropna=False)[
+            "num_casos"
+        ]
+        .sum()
+        .reset_index()
+    )
+    serie["periodo_str"] = serie["periodo"].map(rotulo)
+    return serie
+
+
+def casos_periodo(serie: pd.DataFrame) -> pd.DataFrame:
+    return (
+        serie.groupby(["periodo", "periodo_str"], sort=True)["num_casos"]
+        .sum()
+        .reset_index()
+    )
+
+
+def classificacao_periodo(serie: pd.DataFrame) -> pd.DataFrame:
+    return serie.dropna(subset="classificacaoFinal")
+
+
+def agrega_sintomas(selecao: Selecao) -> pd.DataFrame:
+    """Contagem de cada sintoma por uma redução sobre a matriz de indicadores
+    (no cubo, a matriz das somas de indicadores)"""
+    return (
+        pd.Series(selecao.soma_matriz("sintomas", SINTOMAS), index=SINTOMAS)
+        .sort_values(ascending=False)
+        .reset_index(name="contagem")
+    )
+
+
+def agrega_num_sintomas_classificacao(selecao: Selecao) -> pd.DataFrame:
+    """Distribuição da classificação (confirmado / negativo) por número de
+    sintomas, sem as notificações sem classificação final"""
+    classificadas = selecao.restringe(
+        selecao.coluna("classificacaoFinalSimplificado") >= 0
+    )
+    return tabela_cruzada(classificadas, "numSintomas", "classificacaoRotulo").rename(
+        columns={"classificacaoRotulo": "classificacao_label"}
+    )
+
+
+def combina_mascaras(mascaras) -> np.ndarray | None:
+    """Interseção das máscaras de cada dimensão num único acumulado.
+    None se nenhuma dimensão restringe."""
+    mask = None
+    for mask_dimensao in mascaras:
+        if mask_dimensao is None:
+            continue
+        if mask is None:
+            # As máscaras das dimensões são memoizadas e não podem ser alteradas
+            mask = mask_dimensao.copy()
+        else:
+            mask &= mask_dimensao
+    return mask
+
+
+def mascara_selectize(
+    indices: dict, coluna: str, selecionados: list
+) -> np.ndarray | None:
+    """Máscara de um filtro de seleção múltipla, None quando nada foi selecionado
+    (o filtro não restringe)"""
+    if len(selecionados) == 0:
+        return None
+    return indices[coluna].mascara(selecionados)
+
+
+def mascara_com_nan(
+    indices: dict, coluna: str, selecionados: list
+) -> np.ndarray | None:
+    """Máscara de um filtro de checkbox em que "nan" seleciona os valores nulos,
+    None quando todos os valores estão marcados"""
+    return indices[coluna].mascara(selecionados, incluir_nulos="nan" in selecionados)
@@ -1,22 +1,125 @@
+import os
+
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 
-df_tratado = pd.read_csv("dataset_final.csv", sep=";", low_memory=False, index_col=0)
-df_tratado["dataNotificacao"] = pd.to_datetime(
-    df_tratado["dataNotificacao"].astype(str),
-    errors="coerce",
+from armazem_colunar import anexa_armazem, anexa_indices, anexa_matriz
+from backend_sql import BackendDuckDB
+from colunas_derivadas import aplica_derivadas
+from cubo import DIMENSOES_CATEGORICAS, CuboDados
+from exportacao import esquema_parquet
+from indices import (
+    COLUNAS_INDICE_INVERTIDO,
+    COLUNAS_INDICE_ORDENADO,
+    IndiceInvertido,
+    IndiceOrdenado,
+    OrdenacoesTabela,
 )
-df_tratado["classificacaoFinalSimplificado"] = None
+from tratamento_dado import COLUNAS_DATA, SINTOMAS, TIPOS_SAIDA, converte_datas
+
+PASTA_ARMAZEM = "dataset_final_colunas"
+ARQUIVO_PARQUET = "dataset_final.parquet"
+ARQUIVO_CSV = "dataset_final.csv"
+ARQUIVO_CUBO = "dataset_cubo.parquet"
+ARQUIVO_SERIE = "dataset_serie_diaria.parquet"
+
+# Backend de filtragem e agregação, escolhido pela variável DASHBOARD_BACKEND:
+# "pandas" (padrão) usa os índices em memória; "duckdb" executa consultas SQL
+# embutidas sobre o Parquet, em várias threads e sem carregar o dataset.
+# Nos dois casos o cubo pré-agregado responde primeiro quando pode
+BACKENDS = ("pandas", "duckdb")
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "pandas")
+if BACKEND not in BACKENDS:
+    raise ValueError(f"DASHBOARD_BACKEND deve ser um de {BACKENDS}, não {BACKEND!r}")
+
+
+def calcula_dominio(df: pd.DataFrame) -> dict:
+    """Faixas e valores dos controles de filtro e colunas do dataset.
+
+    :param df: Dataset tratado
+    :type df: pd.DataFrame
+    :return: Mínimo e máximo de idade e dataNotificacao, valores de cada
+        categórica em ordem de aparição (NaN para nulos) e nomes das colunas
+    :rtype: dict
+    """
+    dominio = {
+        "idade": (df["idade"].min().item(), df["idade"].max().item()),
+        "dataNotificacao": (df["dataNotificacao"].min(), df["dataNotificacao"].max()),
+        "colunas": df.columns.tolist(),
+    }
+    for coluna in DIMENSOES_CATEGORICAS:
+        dominio[coluna] = df[coluna].unique().tolist()
+    return dominio
+
 
-# máscara dos negativos
-mask_negativo = df_tratado["classificacaoFinal"].str.contains(
-    "Não Especificada", case=False, na=False
-) | df_tratado["classificacaoFinal"].str.contains("Descartado", case=False, na=False)
+if BACKEND == "duckdb":
+    # O DuckDB lê o Parquet direto: nenhum worker carrega o dataset nem monta
+    # os índices, e os controles de filtro vêm de consultas SQL
+    backend_sql = BackendDuckDB(ARQUIVO_PARQUET)
+    df_tratado = matriz_sintomas = None
+    indices_categoricos = indices_ordenados = ordenacoes_tabela = None
+    dominio_filtros = backend_sql.dominio()
+else:
+    backend_sql = None
+    indices_categoricos = indices_ordenados = matriz_sintomas = None
+    if os.path.isdir(PASTA_ARMAZEM):
+        # Armazém colunar: cada worker anexa os mesmos arquivos mapeados em
+        # memória, sem cópia, e o dataset ocupa RAM uma única vez para todos
+        # os processos
+        df_tratado = anexa_armazem(PASTA_ARMAZEM)
+        matriz_sintomas = anexa_matriz(PASTA_ARMAZEM, "sintomas")
+        # Índices dos filtros também mapeados, em vez de recalculados por worker
+        indices_categoricos = anexa_indices(PASTA_ARMAZEM, "invertido")
+        indices_ordenados = anexa_indices(PASTA_ARMAZEM, "ordenado")
+    elif os.path.exists(ARQUIVO_PARQUET):
+        # Formato colunar: dtypes preservados (datas já convertidas na ingestão)
+        # e leitura via memory map
+        df_tratado = pd.read_parquet(ARQUIVO_PARQUET, memory_map=True)
+    else:
+        df_tratado = pd.read_csv(ARQUIVO_CSV, sep=";", low_memory=False, index_col=0)
+        for coluna in COLUNAS_DATA:
+            df_tratado[coluna] = converte_datas(df_tratado[coluna])
+        # O CSV não guarda os dtypes do dataset tratado nem das colunas derivadas
+        df_tratado = aplica_derivadas(df_tratado.astype(TIPOS_SAIDA))
 
-# atribui 0 para negativos
-df_tratado.loc[mask_negativo, "classificacaoFinalSimplificado"] = 0
+    # Indicadores de sintomas como uma matriz (linhas, sintomas) contígua de uint8
+    if matriz_sintomas is None:
+        matriz_sintomas = np.ascontiguousarray(df_tratado[SINTOMAS].to_numpy(np.uint8))
 
-# atribui 1 para todos os demais (desde que não seja NaN)
-df_tratado.loc[
-    ~mask_negativo & df_tratado["classificacaoFinal"].notna(),
-    "classificacaoFinalSimplificado",
-] = 1
+    # Índices invertidos das colunas usadas nos filtros categóricos
+    if indices_categoricos is None:
+        indices_categoricos = {
+            coluna: IndiceInvertido(df_tratado[coluna])
+            for coluna in COLUNAS_INDICE_INVERTIDO
+        }
+
+    # Índices ordenados das colunas usadas nos filtros de intervalo
+    if indices_ordenados is None:
+        indices_ordenados = {
+            coluna: IndiceOrdenado(df_tratado[coluna])
+            for coluna in COLUNAS_INDICE_ORDENADO
+        }
+
+    # Ordenações da tabela paginada, calculadas por coluna sob demanda
+    ordenacoes_tabela = OrdenacoesTabela(df_tratado)
+    dominio_filtros = calcula_dominio(df_tratado)
+
+# Esquema dos arquivos Parquet exportados: o do dataset tratado (com os
+# metadados do pandas e as categóricas como dicionários), para que os dois
+# backends gerem o mesmo arquivo. Sem o Parquet, vem do dataset carregado
+esquema_exportacao = (
+    pq.read_schema(ARQUIVO_PARQUET)
+    if os.path.exists(ARQUIVO_PARQUET)
+    else esquema_parquet(df_tratado)
+)
+
+# Cubo pré-agregado e série diária gerados na ingestão, usados pelos gráficos
+# quando os filtros se alinham às suas dimensões. Sem eles, tudo é agregado a
+# partir das linhas
+cubo_dados = (
+    CuboDados(pd.read_parquet(ARQUIVO_CUBO)) if os.path.exists(ARQUIVO_CUBO) else None
+)
+serie_dados = (
+    CuboDados(pd.read_parquet(ARQUIVO_SERIE)) if os.path.exists(ARQUIVO_SERIE) else None
+)
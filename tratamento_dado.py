@@ -1,9 +1,73 @@
+import numpy as np
 import pandas as pd
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import LabelEncoder, OneHotEncoder
-from sklearn.preprocessing import MinMaxScaler, RobustScaler
+from colunas_derivadas import aplica_derivadas
 from dicts import mapeamento_regiao, municipios_estados
 
+# Sintomas primários analisados pelo dashboard
+SINTOMAS = [
+    "distúrbios olfativos",
+    "distúrbios gustativos",
+    "outros",
+    "dor de garganta",
+    "dor de cabeça",
+    "dispneia",
+    "febre",
+    "tosse",
+    "coriza",
+    "dificuldade de respirar",
+]
+# Sintomas que só indicam ausência de sintomas e não viram colunas
+SINTOMAS_REDUNDANTES = ["assintomático", "ausência de sintomas primários"]
+# Esquema do export de origem: colunas lidas e dtype compacto de cada uma.
+# Colunas fora do esquema nunca chegam a ser materializadas na leitura.
+ESQUEMA_ENTRADA = {
+    "sintomas": "object",
+    "idade": "Int16",
+    "sexo": "category",
+    "racaCor": "category",
+    "profissionalSeguranca": "category",
+    "profissionalSaude": "category",
+    "municipioNotificacao": "category",
+    "municipio": "category",
+    "totalTestesRealizados": "Int16",
+    "dataNotificacao": "object",
+    "dataInicioSintomas": "object",
+    "classificacaoFinal": "category",
+}
+# Colunas de data do export e o formato em que chegam
+COLUNAS_DATA = ["dataNotificacao", "dataInicioSintomas"]
+FORMATO_DATA = "%Y-%m-%d"
+# Dtypes fixos da saída, para que blocos e lotes tratados separadamente
+# gerem o mesmo esquema no formato binário
+TIPOS_SAIDA = {
+    "idade": "Int16",
+    "sexo": "category",
+    "racaCor": "category",
+    "profissionalSeguranca": "category",
+    "profissionalSaude": "category",
+    "municipioNotificacao": "category",
+    "municipio": "category",
+    "totalTestesRealizados": "Int16",
+    "classificacaoFinal": "category",
+} | {sintoma: "int8" for sintoma in SINTOMAS}
+
+
+def le_lote(arq: str, **kwargs):
+    """Lê um lote do export aplicando o esquema declarado (colunas e dtypes).
+
+    :param arq: Caminho do lote
+    :type arq: str
+    :return: DataFrame, ou leitor em blocos se chunksize for passado
+    :rtype: pd.DataFrame | TextFileReader
+    """
+    return pd.read_csv(
+        arq,
+        sep=";",
+        usecols=list(ESQUEMA_ENTRADA),
+        dtype=ESQUEMA_ENTRADA,
+        **kwargs,
+    )
+
 
 def separaSintomas(celula):
     celula = celula.split(",")
@@ -15,58 +79,79 @@ def separaSintomas(celula):
     return new_celula
 
 
-def tratamento(df: pd.DataFrame):
-    # Levantar todos os sintomas existentes
-    sintomas_list = []
+def codifica_sintomas(
+    sintomas: pd.Series, vocabulario: list[str] | None = None
+) -> tuple[pd.DataFrame, list[str]]:
+    """Codifica a coluna de sintomas em colunas indicadoras (0/1) numa única passada.
+
+    Cada célula é quebrada por vírgula, normalizada (strip + lower) e os tokens
+    são fatorados uma única vez, então a matriz de indicadores é preenchida por
+    indexação vetorizada em vez de varrer a coluna uma vez por sintoma.
+
+    :param sintomas: Coluna com os sintomas separados por vírgula
+    :type sintomas: pd.Series
+    :param vocabulario: Sintomas que viram colunas, na ordem desejada. Se None, o
+        vocabulário é levantado dos próprios dados, em ordem de aparição, defaults to None
+    :type vocabulario: list[str] | None, optional
+    :return: DataFrame int8 com uma coluna por sintoma e o vocabulário usado
+    :rtype: tuple[pd.DataFrame, list[str]]
+    """
+    partes = sintomas.astype(str).str.split(",")
+    linhas = np.repeat(np.arange(len(partes)), partes.str.len().to_numpy())
+    tokens = partes.explode().str.strip().str.lower().to_numpy()
+
+    if vocabulario is None:
+        vocabulario = [t for t in pd.unique(tokens) if t != ""]
+
+    codigos = pd.Categorical(tokens, categories=vocabulario).codes
+    conhecidos = codigos >= 0
+
+    matriz = np.zeros((len(partes), len(vocabulario)), dtype=np.int8)
+    matriz[linhas[conhecidos], codigos[conhecidos]] = 1
+
+    return pd.DataFrame(matriz, index=sintomas.index, columns=vocabulario), vocabulario
+
+
+def converte_datas(serie: pd.Series, formato: str = FORMATO_DATA) -> pd.Series:
+    """Converte uma coluna de datas em texto fazendo o parse de cada valor
+    distinto uma única vez.
+
+    As datas se repetem muito (poucos milhares de dias em milhões de linhas),
+    então os valores são fatorados, só os únicos passam pelo parse com formato
+    explícito e o resultado volta para as linhas pelos códigos.
+
+    :param serie: Coluna com as datas em texto
+    :type serie: pd.Series
+    :param formato: Formato das datas, defaults to FORMATO_DATA
+    :type formato: str, optional
+    :return: Coluna datetime64, com NaT para valores nulos ou inválidos
+    :rtype: pd.Series
+    """
+    codigos, unicos = pd.factorize(serie)
+    datas_unicas = pd.to_datetime(unicos, format=formato, errors="coerce")
+    datas = datas_unicas.take(codigos, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(datas, index=serie.index, name=serie.name)
+
+
+def tratamento(df: pd.DataFrame, vocabulario: list[str] | None = None):
+    # Levantar todos os sintomas existentes e codificar em uma única passada
     df["sintomas"] = df["sintomas"].fillna("Ausência de sintomas primários")
-    for celula in df["sintomas"]:
-        if type(celula) == str:
-            celula_list = separaSintomas(celula)
-            for sintoma in celula_list:
-                if sintoma not in sintomas_list:
-                    sintomas_list.append(sintoma)
-    sintomas_list.remove("")
+    flags, sintomas_list = codifica_sintomas(df["sintomas"], vocabulario)
     print(sintomas_list)
 
-    for sintoma in sintomas_list:
-        possui_sintoma = []
-        i = 0
-        for celula in df["sintomas"]:
-            celula_list = separaSintomas(celula)
-            if sintoma in celula_list:
-                possui_sintoma.append(1)
-            else:
-                possui_sintoma.append(0)
-            i += 1
-        df[sintoma] = possui_sintoma
+    # Sintomas analisados que não aparecem nos dados ficam zerados
+    flags = flags.reindex(
+        columns=list(dict.fromkeys(sintomas_list + SINTOMAS)), fill_value=0
+    ).astype(np.int8)
+    df[flags.columns.tolist()] = flags.to_numpy()
     df = df.drop(
-        columns=["assintomático", "ausência de sintomas primários"], axis=1
+        columns=SINTOMAS_REDUNDANTES, errors="ignore"
     )  # Tirando colunas redundantes
 
-    # Separando sintomas secundários
-    sintomas_secundarios = []
-    df["outrosSintomas"].fillna("Sem sintomas secundários")
-    for celula in df["outrosSintomas"]:
-        if type(celula) == str:
-            celula = separaSintomas(celula)
-            for sintoma in celula:
-                if sintoma not in sintomas_secundarios:
-                    sintomas_secundarios.append(sintoma)
-
-    df["numSintomas"] = df[
-        [
-            "distúrbios olfativos",
-            "distúrbios gustativos",
-            "outros",
-            "dor de garganta",
-            "dor de cabeça",
-            "dispneia",
-            "febre",
-            "tosse",
-            "coriza",
-            "dificuldade de respirar",
-        ]
-    ].sum(axis=1)
+    for coluna in COLUNAS_DATA:
+        df[coluna] = converte_datas(df[coluna])
+
+    df["numSintomas"] = df[SINTOMAS].sum(axis=1).astype(np.int8)
     retained_columns = (
         [
             "idade",
@@ -81,20 +166,10 @@ def tratamento(df: pd.DataFrame):
             "dataInicioSintomas",
             "numSintomas",
         ]
-        + [
-            "distúrbios olfativos",
-            "distúrbios gustativos",
-            "outros",
-            "dor de garganta",
-            "dor de cabeça",
-            "dispneia",
-            "febre",
-            "tosse",
-            "coriza",
-            "dificuldade de respirar",
-        ]
+        + SINTOMAS
         + ["classificacaoFinal"]
     )
-    df = df[retained_columns]
+    df = df[retained_columns].astype(TIPOS_SAIDA)
+    df = aplica_derivadas(df)
 
     return df
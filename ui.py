@@ -3,20 +3,15 @@ import faicons as fa
 from shinywidgets import output_widget
 
 from shiny import ui
-from shared import df_tratado
+from shared import dominio_filtros
+from exportacao import FORMATOS_EXPORTACAO
 
-idade_range = (
-    df_tratado["idade"].min().item(),
-    df_tratado["idade"].max().item(),
-)
-raca_cor_lista = df_tratado["racaCor"].unique().tolist()
-sexo_lista = df_tratado["sexo"].unique().tolist()
-municipio_lista = df_tratado["municipio"].unique().tolist()
-classificacao_final_lista = df_tratado["classificacaoFinal"].unique().tolist()
-data_range = (
-    df_tratado["dataNotificacao"].min(),
-    df_tratado["dataNotificacao"].max(),
-)
+idade_range = dominio_filtros["idade"]
+raca_cor_lista = dominio_filtros["racaCor"]
+sexo_lista = dominio_filtros["sexo"]
+municipio_lista = dominio_filtros["municipio"]
+classificacao_final_lista = dominio_filtros["classificacaoFinal"]
+data_range = dominio_filtros["dataNotificacao"]
 
 ICONS = {
     "user": fa.icon_svg("user", "regular"),
@@ -98,8 +93,29 @@ app_ui = ui.page_sidebar(
     ),
     ui.card(
         ui.card_header("Dados de Notificação"),
+        ui.layout_columns(
+            ui.input_select(
+                "ordem_tabela",
+                "Ordenar por",
+                {"": "Ordem original"} | {c: c for c in dominio_filtros["colunas"]},
+            ),
+            ui.input_switch("ordem_decrescente", "Decrescente"),
+            ui.input_numeric("pagina_tabela", "Página", value=1, min=1),
+            ui.output_text("paginacao_tabela"),
+            fill=False,
+        ),
+        ui.layout_columns(
+            ui.input_radio_buttons(
+                "formato_exportacao",
+                "Formato",
+                FORMATOS_EXPORTACAO,
+                inline=True,
+            ),
+            ui.download_button("exporta_dados", "Exportar seleção"),
+            fill=False,
+        ),
         ui.output_data_frame("table"),
-        height="400px",
+        height="500px",
         fill=False,
         full_screen=True,
     ),
@@ -107,6 +123,13 @@ app_ui = ui.page_sidebar(
         ui.card_header(
             "Número de casos",
         ),
+        ui.input_radio_buttons(
+            "granularidade",
+            "Granularidade",
+            {"dia": "Diária", "semana": "Semana epidemiológica", "mes": "Mensal"},
+            selected="mes",
+            inline=True,
+        ),
         output_widget("grafico_numero_casos"),
         height="400px",
         fill=False,
@@ -1,28 +1,494 @@
-import plotly.express as px
-
-# Load data and compute static values
-from shinywidgets import render_plotly
-
-from shiny import reactive, render, ui
+import argparse
 import glob
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from armazem_colunar import grava_armazem
+from cubo import DIMENSOES_SERIE, MEDIDAS_SERIE, constroi_cubo_parquet
+from indices import COLUNAS_INDICE_INVERTIDO, COLUNAS_INDICE_ORDENADO
+from tratamento_dado import SINTOMAS, le_lote, tratamento
+
+ARQUIVOS_SAIDA = {
+    "parquet": "dataset_final.parquet",
+    "csv": "dataset_final.csv",
+}
+# Armazém colunar mapeado em memória, compartilhado entre os workers do app
+PASTA_ARMAZEM = "dataset_final_colunas"
+# Quantas vezes o tamanho do bloco cru o tratamento chega a ocupar em memória
+# (listas de sintomas, matriz de indicadores e cópias intermediárias)
+FATOR_PICO_TRATAMENTO = 4
+# Modo incremental: registro dos lotes já processados e resultado tratado de cada um
+ARQUIVO_MANIFESTO = "dataset_manifesto.json"
+PASTA_PARTICOES_TRATADAS = "dados_tratados"
+# Módulos que definem o tratamento, o esquema e as colunas derivadas: qualquer
+# mudança neles invalida os lotes tratados guardados
+MODULOS_TRATAMENTO = ["tratamento_dado.py", "colunas_derivadas.py", "dicts.py"]
+# Cubo de contagens e somas pré-agregadas que alimenta os gráficos do dashboard
+ARQUIVO_CUBO = "dataset_cubo.parquet"
+# Contagens por dia e dimensões de filtro, base das séries temporais
+ARQUIVO_SERIE = "dataset_serie_diaria.parquet"
+
+
+def lista_particoes(padrao: str = "dados/*.csv") -> list[str]:
+    """Lista os arquivos de lote em ordem determinística"""
+    return sorted(glob.glob(padrao))
+
+
+def esquema_estavel(esquema: pa.Schema) -> pa.Schema:
+    """Fixa um esquema Arrow que aceita todos os blocos do dataset tratado.
+
+    Categóricas de blocos diferentes têm dicionários (e larguras de índice)
+    diferentes, e colunas de texto totalmente nulas em um bloco viram o tipo null.
+    """
+    campos = []
+    for campo in esquema:
+        if pa.types.is_dictionary(campo.type):
+            campo = campo.with_type(
+                pa.dictionary(pa.int32(), pa.string(), campo.type.ordered)
+            )
+        elif pa.types.is_null(campo.type):
+            campo = campo.with_type(pa.string())
+        campos.append(campo)
+    return pa.schema(campos, metadata=esquema.metadata)
+
+
+class GravadorDataset:
+    """Grava o dataset tratado bloco a bloco, em CSV ou Parquet.
+
+    No Parquet cada bloco vira um row group, preservando os dtypes
+    (categóricas, datas e indicadores int8) para a leitura no app.
+
+    :param saida: Caminho do arquivo de saída
+    :type saida: str
+    :param formato: Formato da saída
+    :type formato: Literal["parquet", "csv"]
+    """
+
+    def __init__(self, saida: str, formato: Literal["parquet", "csv"]):
+        self.saida = saida
+        self.formato = formato
+        self.escritor_parquet = None
+        self.esquema = None
+        self.primeiro_bloco = True
+
+    def escreve(self, df: pd.DataFrame):
+        if self.formato == "csv":
+            df.to_csv(
+                self.saida,
+                sep=";",
+                mode="w" if self.primeiro_bloco else "a",
+                header=self.primeiro_bloco,
+            )
+        else:
+            self.escreve_tabela(pa.Table.from_pandas(df, preserve_index=False))
+        self.primeiro_bloco = False
+
+    def escreve_tabela(self, tabela: pa.Table):
+        if self.escritor_parquet is None:
+            self.esquema = esquema_estavel(tabela.schema)
+            self.escritor_parquet = pq.ParquetWriter(self.saida, self.esquema)
+        self.escritor_parquet.write_table(tabela.cast(self.esquema))
+
+    def fecha(self):
+        if self.escritor_parquet is not None:
+            self.escritor_parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fecha()
+
+
+def unifica(lista_arqs: list[str], saida: str, formato: str):
+    """Lê todos os lotes em memória, concatena e trata o conjunto inteiro"""
+    print("INICIA CARREGAMENTO DOS DATASETS")
+    lista_dfs = []
+    for arq in lista_arqs:
+        df_novo = le_lote(arq)
+        lista_dfs.append(df_novo)
+
+    df_final = pd.concat(lista_dfs)
+    print("UNIFICAÇÃO DOS DATASETS FINALIZADO")
+
+    print("TRATAMENTO DOS DATASETS INICIADO")
+    df_tratado = tratamento(df_final)
+    print("TRATAMENTO DOS DATASETS FINALIZADO")
+    with GravadorDataset(saida, formato) as gravador:
+        gravador.escreve(df_tratado)
+
+
+def estima_linhas_por_bloco(arq: str, memoria_max_mb: int, amostra: int = 1000) -> int:
+    """Estima quantas linhas de um lote cabem no teto de memória durante o tratamento
+
+    :param arq: Caminho do lote
+    :type arq: str
+    :param memoria_max_mb: Teto de memória em MB para um bloco em tratamento
+    :type memoria_max_mb: int
+    :param amostra: Linhas lidas para medir o tamanho médio de uma linha, defaults to 1000
+    :type amostra: int, optional
+    :return: Número de linhas por bloco
+    :rtype: int
+    """
+    df_amostra = le_lote(arq, nrows=amostra)
+    bytes_por_linha = df_amostra.memory_usage(deep=True).sum() / max(len(df_amostra), 1)
+    teto_bytes = memoria_max_mb * 1024**2
+    return max(int(teto_bytes / (bytes_por_linha * FATOR_PICO_TRATAMENTO)), 1)
+
+
+def unifica_streaming(
+    lista_arqs: list[str], memoria_max_mb: int, saida: str, formato: str
+):
+    """Lê cada lote em blocos limitados pelo teto de memória, trata cada bloco de
+    forma independente e acrescenta o resultado ao arquivo de saída.
+
+    O vocabulário de sintomas é fixo para que todos os blocos gerem as mesmas colunas.
+    """
+    with GravadorDataset(saida, formato) as gravador:
+        for arq in lista_arqs:
+            linhas_por_bloco = estima_linhas_por_bloco(arq, memoria_max_mb)
+            print(f"LENDO {arq} EM BLOCOS DE {linhas_por_bloco} LINHAS")
+
+            for bloco in le_lote(arq, chunksize=linhas_por_bloco):
+                gravador.escreve(tratamento(bloco, vocabulario=SINTOMAS))
+
+
+def trata_particao(arq: str) -> pd.DataFrame:
+    """Lê e trata um único lote. Executado nos processos do modo paralelo."""
+    df = le_lote(arq)
+    return tratamento(df, vocabulario=SINTOMAS)
+
+
+def unifica_paralelo(
+    lista_arqs: list[str], saida: str, formato: str, workers: int | None = None
+):
+    """Trata cada lote em um processo separado e junta os resultados na ordem
+    dos arquivos, de forma que a saída não depende da ordem de término dos processos.
+
+    :param lista_arqs: Lotes a processar
+    :type lista_arqs: list[str]
+    :param saida: Arquivo de saída
+    :type saida: str
+    :param formato: Formato da saída, "parquet" ou "csv"
+    :type formato: str
+    :param workers: Número de processos, defaults to None (um por núcleo)
+    :type workers: int | None, optional
+    """
+    print(f"TRATAMENTO PARALELO COM {workers or os.cpu_count()} PROCESSOS")
+    with ProcessPoolExecutor(max_workers=workers) as executor, GravadorDataset(
+        saida, formato
+    ) as gravador:
+        for df_tratado in executor.map(trata_particao, lista_arqs):
+            gravador.escreve(df_tratado)
+
+
+def hash_arquivo(arq: str, tamanho_bloco: int = 1024**2) -> str:
+    """Calcula o SHA-256 do conteúdo do arquivo lendo em blocos"""
+    sha = hashlib.sha256()
+    with open(arq, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def versao_tratamento() -> str:
+    """Hash do código do tratamento, gravado no manifesto junto a cada lote"""
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    sha = hashlib.sha256()
+    for modulo in MODULOS_TRATAMENTO:
+        sha.update(bytes.fromhex(hash_arquivo(os.path.join(pasta, modulo))))
+    return sha.hexdigest()
+
+
+def carrega_manifesto(caminho: str = ARQUIVO_MANIFESTO) -> dict:
+    """Carrega o manifesto dos lotes processados, indexado pelo caminho do lote"""
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def salva_manifesto(manifesto: dict, caminho: str = ARQUIVO_MANIFESTO):
+    """Grava o manifesto de forma atômica para não corromper em caso de interrupção"""
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def assinatura_particao(
+    arq: str, anterior: dict | None = None, versao: str | None = None
+) -> dict:
+    """Levanta caminho, tamanho, mtime e hash de um lote, e a versão do
+    tratamento que gerou seu resultado.
+
+    Se tamanho e mtime batem com a assinatura anterior, o hash anterior é
+    reaproveitado para não reler o arquivo.
+    """
+    stat = os.stat(arq)
+    assinatura = {
+        "caminho": arq,
+        "tamanho": stat.st_size,
+        "mtime": stat.st_mtime,
+        "versao": versao,
+    }
+    if (
+        anterior is not None
+        and anterior["tamanho"] == assinatura["tamanho"]
+        and anterior["mtime"] == assinatura["mtime"]
+    ):
+        assinatura["hash"] = anterior["hash"]
+    else:
+        assinatura["hash"] = hash_arquivo(arq)
+    return assinatura
+
+
+def caminho_particao_tratada(assinatura: dict, formato: str) -> str:
+    return os.path.join(PASTA_PARTICOES_TRATADAS, f"{assinatura['hash']}.{formato}")
+
+
+def grava_particao_tratada(df: pd.DataFrame, caminho: str, formato: str):
+    with GravadorDataset(caminho, formato) as gravador:
+        gravador.escreve(df)
+
+
+def unifica_incremental(
+    lista_arqs: list[str],
+    saida: str,
+    formato: str,
+    paralelo: bool = False,
+    workers: int | None = None,
+):
+    """Trata apenas os lotes novos ou alterados desde a última execução.
+
+    O resultado tratado de cada lote fica guardado em PASTA_PARTICOES_TRATADAS,
+    identificado pelo hash do conteúdo. A saída é remontada a partir desses
+    resultados, o que descarta os lotes removidos de dados/. Uma mudança no
+    código do tratamento (versao_tratamento) faz todos os lotes serem tratados
+    de novo.
+    """
+    manifesto = carrega_manifesto()
+    versao = versao_tratamento()
+    os.makedirs(PASTA_PARTICOES_TRATADAS, exist_ok=True)
+
+    novo_manifesto = {}
+    pendentes = []
+    for arq in lista_arqs:
+        assinatura = assinatura_particao(arq, manifesto.get(arq), versao)
+        novo_manifesto[arq] = assinatura
+        anterior = manifesto.get(arq)
+        if (
+            anterior is None
+            or anterior["hash"] != assinatura["hash"]
+            or anterior.get("versao") != versao
+            or not os.path.exists(caminho_particao_tratada(assinatura, formato))
+        ):
+            pendentes.append(arq)
+
+    removidos = [arq for arq in manifesto if arq not in novo_manifesto]
+    print(
+        f"{len(pendentes)} LOTES NOVOS OU ALTERADOS, {len(removidos)} REMOVIDOS, "
+        f"{len(lista_arqs) - len(pendentes)} REAPROVEITADOS"
+    )
+
+    if pendentes:
+        if paralelo:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                dfs_pendentes = executor.map(trata_particao, pendentes)
+                for arq, df_tratado in zip(pendentes, dfs_pendentes):
+                    grava_particao_tratada(
+                        df_tratado,
+                        caminho_particao_tratada(novo_manifesto[arq], formato),
+                        formato,
+                    )
+        else:
+            for arq in pendentes:
+                grava_particao_tratada(
+                    trata_particao(arq),
+                    caminho_particao_tratada(novo_manifesto[arq], formato),
+                    formato,
+                )
+
+    # Resultados tratados que não pertencem mais a nenhum lote
+    hashes_validos = {assinatura["hash"] for assinatura in novo_manifesto.values()}
+    for assinatura in manifesto.values():
+        if assinatura["hash"] not in hashes_validos:
+            for formato_antigo in ARQUIVOS_SAIDA:
+                caminho = caminho_particao_tratada(assinatura, formato_antigo)
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+
+    if pendentes or removidos or not os.path.exists(saida):
+        junta_particoes_tratadas(
+            [
+                caminho_particao_tratada(novo_manifesto[arq], formato)
+                for arq in lista_arqs
+            ],
+            saida,
+            formato,
+        )
+    salva_manifesto(novo_manifesto)
+
+
+def junta_particoes_tratadas(caminhos: list[str], saida: str, formato: str):
+    """Concatena os lotes tratados sem reprocessá-los. No Parquet cada lote vira
+    um row group; no CSV os arquivos são copiados mantendo um único cabeçalho."""
+    if formato == "parquet":
+        with GravadorDataset(saida, formato) as gravador:
+            for caminho in caminhos:
+                gravador.escreve_tabela(pq.read_table(caminho))
+        return
+
+    with open(saida, "wb") as f_saida:
+        for i, caminho in enumerate(caminhos):
+            with open(caminho, "rb") as f_particao:
+                if i > 0:
+                    f_particao.readline()  # pula o cabeçalho
+                shutil.copyfileobj(f_particao, f_saida)
+
+
+def relatorio_memoria(lista_arqs: list[str], amostra: int | None = 100_000):
+    """Compara a memória ocupada lendo os lotes com e sem o esquema declarado
+
+    :param lista_arqs: Lotes a medir
+    :type lista_arqs: list[str]
+    :param amostra: Linhas lidas de cada lote, defaults to 100_000 (None lê tudo)
+    :type amostra: int | None, optional
+    """
+    total_sem_esquema = 0
+    total_com_esquema = 0
+    for arq in lista_arqs:
+        sem_esquema = (
+            pd.read_csv(arq, sep=";", low_memory=False, nrows=amostra)
+            .memory_usage(deep=True)
+            .sum()
+        )
+        com_esquema = le_lote(arq, nrows=amostra).memory_usage(deep=True).sum()
+        print(
+            f"{arq}: {sem_esquema / 1024**2:.1f} MB -> {com_esquema / 1024**2:.1f} MB"
+        )
+        total_sem_esquema += sem_esquema
+        total_com_esquema += com_esquema
+
+    economia = 1 - total_com_esquema / max(total_sem_esquema, 1)
+    print(
+        f"TOTAL: {total_sem_esquema / 1024**2:.1f} MB -> "
+        f"{total_com_esquema / 1024**2:.1f} MB ({economia:.0%} de economia)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Unifica e trata os arquivos de lote em dados/"
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Processa os lotes em blocos em vez de carregar tudo em memória",
+    )
+    parser.add_argument(
+        "--memoria-max",
+        type=int,
+        default=512,
+        help="Teto de memória em MB por bloco no modo streaming (padrão: 512)",
+    )
+    parser.add_argument(
+        "--paralelo",
+        action="store_true",
+        help="Trata cada lote em um processo separado",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Número de processos no modo paralelo (padrão: número de núcleos)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"Trata só os lotes novos ou alterados, com base em {ARQUIVO_MANIFESTO}",
+    )
+    parser.add_argument(
+        "--formato",
+        choices=list(ARQUIVOS_SAIDA),
+        default="parquet",
+        help="Formato do dataset final (padrão: parquet)",
+    )
+    parser.add_argument(
+        "--relatorio-memoria",
+        action="store_true",
+        help="Só mede a memória economizada pelo esquema de leitura e sai",
+    )
+    parser.add_argument(
+        "--armazem-colunar",
+        action="store_true",
+        help=f"Gera também o armazém colunar em {PASTA_ARMAZEM}/ a partir do Parquet",
+    )
+    args = parser.parse_args()
+    if args.armazem_colunar and args.formato != "parquet":
+        parser.error("--armazem-colunar requer --formato parquet")
+    # O modo streaming lê os lotes em blocos num único processo e não tem
+    # versão incremental nem paralela
+    if args.streaming and args.incremental:
+        parser.error("--streaming não pode ser combinado com --incremental")
+    if args.streaming and args.paralelo:
+        parser.error("--streaming não pode ser combinado com --paralelo")
+
+    lista_arqs = lista_particoes()
+    if args.relatorio_memoria:
+        relatorio_memoria(lista_arqs)
+        return
 
-from tratamento_dado import tratamento
+    saida = ARQUIVOS_SAIDA[args.formato]
+    if args.incremental:
+        unifica_incremental(
+            lista_arqs, saida, args.formato, args.paralelo, args.workers
+        )
+    elif args.streaming:
+        unifica_streaming(lista_arqs, args.memoria_max, saida, args.formato)
+    elif args.paralelo:
+        unifica_paralelo(lista_arqs, saida, args.formato, args.workers)
+    else:
+        unifica(lista_arqs, saida, args.formato)
 
-print("INICIA CARREGAMENTO DOS DATASETS")
-# Unificação e tratamento dos arquivos de lote
-lista_arqs = glob.glob("dados/*.csv")
+    if args.formato == "parquet":
+        print("GERANDO CUBO")
+        constroi_cubo_parquet(saida).to_parquet(ARQUIVO_CUBO)
+        constroi_cubo_parquet(saida, DIMENSOES_SERIE, MEDIDAS_SERIE).to_parquet(
+            ARQUIVO_SERIE
+        )
+    else:
+        # O Parquet e os cubos de uma ingestão anterior não corresponderiam ao
+        # novo dataset, e o app leria o Parquet antes do CSV
+        for arquivo in (ARQUIVOS_SAIDA["parquet"], ARQUIVO_CUBO, ARQUIVO_SERIE):
+            if os.path.exists(arquivo):
+                os.remove(arquivo)
 
-lista_dfs = []
-for arq in lista_arqs:
-    df_novo = pd.read_csv(arq, sep=";", low_memory=False)
-    lista_dfs.append(df_novo)
+    if args.armazem_colunar:
+        print("GERANDO ARMAZÉM COLUNAR")
+        grava_armazem(
+            pd.read_parquet(saida),
+            PASTA_ARMAZEM,
+            matrizes={"sintomas": SINTOMAS},
+            indices={
+                "invertido": COLUNAS_INDICE_INVERTIDO,
+                "ordenado": COLUNAS_INDICE_ORDENADO,
+            },
+        )
+    else:
+        # O app lê o armazém antes dos arquivos: um armazém de uma ingestão
+        # anterior esconderia o dataset novo
+        shutil.rmtree(PASTA_ARMAZEM, ignore_errors=True)
+    print("FINALIZADO")
 
-df_final = pd.concat(lista_dfs)
-print("UNIFICAÇÃO DOS DATASETS FINALIZADO")
 
-print("TRATAMENTO DOS DATASETS INICIADO")
-df_tratado = tratamento(df_final)
-print("TRATAMENTO DOS DATASETS FINALIZADO")
-df_tratado.to_csv("dataset_final.csv", sep=";")
-print("FINALIZADO")
+if __name__ == "__main__":
+    main()